@@ -1,42 +1,517 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, render_template, request, send_file, jsonify, url_for, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
-from docx import Document
-from groq import Groq
 import tempfile
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_TAB_ALIGNMENT, WD_TAB_LEADER
 from datetime import datetime
-from docx.oxml import parse_xml
-from docx.shared import Inches
 import re
+from collections import namedtuple
+from dataclasses import dataclass
+import contextvars
+import io
+import functools
+import importlib
+import threading
 import time
+import json
+import math
+import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import RateLimiter
+from llm_cache import LLMCache, cache_key
+from jobs import JobStore, JobReporter, JobQueue, QUEUED, DONE, FAILED
+from artifacts import ArtifactStore
+from formatting_cache import FormattingCache
+from model_router import ModelRouter, is_failover_error
+from word_budget import TokenCalibrator, WordBudget
+from docx_stream import W_NS, DocxStreamWriter, STYLES, STYLE_IDS, is_xml_safe, style_element_xml
+import metrics
+# python-docx, groq and httpx are imported inside the functions that use them, so processes
+# that never build a document or call the LLM (health checks, maintenance scripts) start fast
+# (see benchmarks/import_time.py)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Maximum number of section completions in flight per report
+app.config['GENERATION_CONCURRENCY'] = int(os.environ.get('GENERATION_CONCURRENCY', 4))
+
+# Groq quota shared by every thread in this process (0 disables a bucket)
+app.config['GROQ_REQUESTS_PER_MINUTE'] = int(os.environ.get('GROQ_REQUESTS_PER_MINUTE', 30))
+app.config['GROQ_TOKENS_PER_MINUTE'] = int(os.environ.get('GROQ_TOKENS_PER_MINUTE', 30000))
+# On-disk completion cache (size cap in bytes, TTL in seconds; 0 disables either)
+app.config['LLM_CACHE_PATH'] = os.environ.get('LLM_CACHE_PATH', os.path.join('instance', 'llm_cache.sqlite3'))
+app.config['LLM_CACHE_MAX_BYTES'] = int(os.environ.get('LLM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+app.config['LLM_CACHE_TTL'] = int(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))
+# Upper bound on max_tokens for one section completion; longer sections are continued
+app.config['SECTION_MAX_TOKENS'] = int(os.environ.get('SECTION_MAX_TOKENS', 2048))
+# Most completions one section is split into; beyond that each part is asked for more words
+app.config['SECTION_MAX_PARTS'] = int(os.environ.get('SECTION_MAX_PARTS', 3))
+# Background report jobs
+app.config['JOB_DB_PATH'] = os.environ.get('JOB_DB_PATH', os.path.join('instance', 'jobs.sqlite3'))
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# Finished and failed jobs, their events and checkpoints are deleted after this many seconds (0 keeps them)
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 30 * 24 * 3600))
+# Event streams end after this many seconds and the browser reconnects from the last event,
+# so a few open tabs cannot hold every server thread for the length of a report
+app.config['EVENT_STREAM_SECONDS'] = int(os.environ.get('EVENT_STREAM_SECONDS', 30))
+# Finished reports, named by content hash; LRU eviction by total size and age (0 disables
+# either). With ARTIFACT_STORAGE=none nothing is kept and downloads are rendered on the fly.
+app.config['ARTIFACT_DIR'] = os.environ.get('ARTIFACT_DIR', os.path.join('instance', 'artifacts'))
+app.config['ARTIFACT_MAX_BYTES'] = int(os.environ.get('ARTIFACT_MAX_BYTES', 256 * 1024 * 1024))
+app.config['ARTIFACT_MAX_AGE'] = int(os.environ.get('ARTIFACT_MAX_AGE', 7 * 24 * 3600))
+app.config['ARTIFACT_STORAGE'] = os.environ.get('ARTIFACT_STORAGE', 'disk')
+# Parsed formatting of uploaded template .docx files, by content hash
+app.config['TEMPLATE_DB_PATH'] = os.environ.get('TEMPLATE_DB_PATH', os.path.join('instance', 'templates.sqlite3'))
+# Metrics snapshots of every worker process, summed by /metrics; workers publish this often (seconds)
+app.config['METRICS_DB_PATH'] = os.environ.get('METRICS_DB_PATH', os.path.join('instance', 'metrics.sqlite3'))
+app.config['METRICS_PUBLISH_SECONDS'] = float(os.environ.get('METRICS_PUBLISH_SECONDS', 10))
+# Identical submissions join an active job unless it has not progressed for this many seconds
+app.config['JOB_DEDUP_STALE_SECONDS'] = int(os.environ.get('JOB_DEDUP_STALE_SECONDS', 600))
+# Shared LLM client: timeouts in seconds, optional "module:callable" factory for a stub or fake backend
+app.config['GROQ_TIMEOUT'] = float(os.environ.get('GROQ_TIMEOUT', 120))
+app.config['GROQ_CONNECT_TIMEOUT'] = float(os.environ.get('GROQ_CONNECT_TIMEOUT', 10))
+app.config['LLM_CLIENT_FACTORY'] = os.environ.get('LLM_CLIENT_FACTORY', '')
+# Connections the shared LLM client may open; 0 sizes it for every running job (see _create_llm_client)
+app.config['LLM_POOL_SIZE'] = int(os.environ.get('LLM_POOL_SIZE', 0))
+# Model routing: sections targeting at most LLM_SHORT_SECTION_WORDS words go to the fast model.
+# A call that times out (after LLM_FAILOVER_TIMEOUT seconds) or is rate limited fails over to
+# the other model, and a model failing more than LLM_MAX_ERROR_RATE of recent calls is tried last.
+app.config['LLM_MODEL'] = os.environ.get('LLM_MODEL', 'llama3-70b-8192')
+app.config['LLM_FAST_MODEL'] = os.environ.get('LLM_FAST_MODEL', 'llama-3.1-8b-instant')
+app.config['LLM_SHORT_SECTION_WORDS'] = int(os.environ.get('LLM_SHORT_SECTION_WORDS', 150))
+app.config['LLM_FAILOVER_TIMEOUT'] = float(os.environ.get('LLM_FAILOVER_TIMEOUT', 30))
+app.config['LLM_MAX_ERROR_RATE'] = float(os.environ.get('LLM_MAX_ERROR_RATE', 0.5))
+# Attach each report's stage timings to its download response
+app.config['REPORT_TRACE_HEADERS'] = os.environ.get('REPORT_TRACE_HEADERS', '1') == '1'
+# Output engine: 'stream' writes document.xml directly, 'python-docx' builds the object model
+app.config['DOCX_WRITER'] = os.environ.get('DOCX_WRITER', 'stream')
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+rate_limiter = RateLimiter(
+    app.config['GROQ_REQUESTS_PER_MINUTE'],
+    app.config['GROQ_TOKENS_PER_MINUTE']
+)
+
+llm_cache = LLMCache(
+    app.config['LLM_CACHE_PATH'],
+    app.config['LLM_CACHE_MAX_BYTES'],
+    app.config['LLM_CACHE_TTL']
+)
+
+artifact_store = ArtifactStore(
+    app.config['ARTIFACT_DIR'],
+    app.config['ARTIFACT_MAX_BYTES'],
+    app.config['ARTIFACT_MAX_AGE']
+)
+
+model_router = ModelRouter(
+    {
+        'section': app.config['LLM_MODEL'],
+        'short_section': app.config['LLM_FAST_MODEL'] or app.config['LLM_MODEL'],
+        'outline': app.config['LLM_MODEL'],
+        'references': app.config['LLM_MODEL'],
+    },
+    [model for model in (app.config['LLM_MODEL'], app.config['LLM_FAST_MODEL']) if model],
+    max_error_rate=app.config['LLM_MAX_ERROR_RATE']
+)
+
+formatting_cache = FormattingCache(app.config['TEMPLATE_DB_PATH'])
+
+metrics_store = metrics.MetricsStore(app.config['METRICS_DB_PATH'])
+
+# Completion tokens per word, learned from section responses across all reports
+token_calibrator = TokenCalibrator()
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def _create_llm_client():
+    factory_path = app.config['LLM_CLIENT_FACTORY']
+    if factory_path:
+        module_name, _, attr = factory_path.partition(':')
+        return getattr(importlib.import_module(module_name), attr)()
+
+    import httpx
+    from groq import Groq
+
+    # Every in-flight section of every running job may hold a connection, and so may its references
+    pool_size = app.config['LLM_POOL_SIZE'] or (app.config['GENERATION_CONCURRENCY'] + 1) * app.config['JOB_WORKERS']
+    timeout = httpx.Timeout(app.config['GROQ_TIMEOUT'], connect=app.config['GROQ_CONNECT_TIMEOUT'])
+    http_client = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    )
+    # Retries on 429 are handled by the rate limiter, not the client
+    return Groq(max_retries=0, timeout=timeout, http_client=http_client)
+
+def get_llm_client():
+    """Process-wide LLM client reusing one keep-alive connection pool.
+
+    Any object exposing `chat.completions.create(...)` like the Groq SDK can
+    serve as the backend; see set_llm_client and LLM_CLIENT_FACTORY.
+    """
+    global _llm_client
+    with _llm_client_lock:
+        # Built on first use so each forked worker opens its own connections
+        if _llm_client is None:
+            _llm_client = _create_llm_client()
+        return _llm_client
+
+def set_llm_client(client):
+    """Replace the shared LLM client, e.g. with a fake backend for tests and benchmarks"""
+    global _llm_client
+    with _llm_client_lock:
+        _llm_client = client
+
+def _estimate_tokens(*texts):
+    """Rough prompt token count (about four characters per token)"""
+    return sum(len(text) for text in texts) // 4 + 1
+
+def _messages(system_prompt, user_prompt):
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": user_prompt
+        }
+    ]
+
+def _calibrate(usage, content):
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if completion_tokens:
+        token_calibrator.observe(completion_tokens, len(content.split()))
+
+def _request_options(timeout):
+    # Only passed when set, so the client's own timeout applies otherwise
+    return {} if timeout is None else {'timeout': timeout}
+
+def _chat_completion(system_prompt, user_prompt, temperature=0.7, max_tokens=2048, model="llama3-70b-8192", bypass_cache=False, calibrate=False, timeout=None, max_retries=None):
+    """Return a Groq chat completion, served from the cache or run through the shared rate limiter.
+
+    With calibrate=True a fresh completion's usage updates token_calibrator.
+    `timeout` and `max_retries` override the client timeout and the rate
+    limiter's 429 retries for this call.
+    """
+    key = cache_key(model, system_prompt, user_prompt, temperature, max_tokens)
+    if not bypass_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            metrics.record_cache_hit(model)
+            return cached
+
+    client = get_llm_client()
+
+    def create():
+        return client.chat.completions.create(
+            model=model,
+            messages=_messages(system_prompt, user_prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **_request_options(timeout)
+        )
+
+    def used_tokens(completion):
+        usage = getattr(completion, 'usage', None)
+        return getattr(usage, 'total_tokens', None)
+
+    start = time.perf_counter()
+    try:
+        completion, stats = rate_limiter.call(
+            create,
+            _estimate_tokens(system_prompt, user_prompt) + max_tokens,
+            used_tokens,
+            max_retries
+        )
+    except Exception as e:
+        # Time spent waiting on the limiter or backing off is not the model's latency
+        stats = getattr(e, 'limiter_stats', None) or {'waited': 0.0, 'retries': 0}
+        seconds = time.perf_counter() - start - stats['waited']
+        metrics.record_llm_call(model, seconds, 'error', stats['waited'], stats['retries'])
+        model_router.observe(model, seconds, False)
+        raise
+    seconds = time.perf_counter() - start - stats['waited']
+    metrics.record_llm_call(
+        model,
+        seconds,
+        'ok',
+        stats['waited'],
+        stats['retries'],
+        getattr(completion, 'usage', None)
+    )
+    model_router.observe(model, seconds, True)
+    content = completion.choices[0].message.content
+    if calibrate:
+        _calibrate(getattr(completion, 'usage', None), content)
+    # Fresh results are stored even when bypassing, so the next request can reuse them
+    llm_cache.put(key, content)
+    return content
+
+def _chat_completion_stream(system_prompt, user_prompt, temperature=0.7, max_tokens=2048, model="llama3-70b-8192", bypass_cache=False, calibrate=False, timeout=None, max_retries=None):
+    """Yield a Groq chat completion's text as it arrives; cached completions are yielded whole"""
+    key = cache_key(model, system_prompt, user_prompt, temperature, max_tokens)
+    if not bypass_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            metrics.record_cache_hit(model)
+            yield cached
+            return
+
+    client = get_llm_client()
+
+    def create():
+        return client.chat.completions.create(
+            model=model,
+            messages=_messages(system_prompt, user_prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **_request_options(timeout)
+        )
+
+    start = time.perf_counter()
+    stats = {'waited': 0.0, 'retries': 0}
+    usage = None
+    parts = []
+    estimated_tokens = _estimate_tokens(system_prompt, user_prompt) + max_tokens
+    try:
+        # 429s surface when the stream is opened, so only that part runs under the limiter
+        stream, stats = rate_limiter.call(create, estimated_tokens, max_retries=max_retries)
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            # Groq reports usage on the final chunk
+            usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        stats = getattr(e, 'limiter_stats', None) or stats
+        seconds = time.perf_counter() - start - stats['waited']
+        metrics.record_llm_call(model, seconds, 'error', stats['waited'], stats['retries'])
+        model_router.observe(model, seconds, False)
+        raise
+    seconds = time.perf_counter() - start - stats['waited']
+    metrics.record_llm_call(model, seconds, 'ok', stats['waited'], stats['retries'], usage)
+    model_router.observe(model, seconds, True)
+    # Usage only arrives with the final chunk, so unused tokens are refunded here
+    rate_limiter.refund(estimated_tokens, getattr(usage, 'total_tokens', None))
+    content = ''.join(parts)
+    if calibrate:
+        _calibrate(usage, content)
+    llm_cache.put(key, content)
+
+def _attempts(route, label):
+    """Yield (model, options) for each model model_router offers for `route`, logging the choice.
+
+    Every attempt but the last gets LLM_FAILOVER_TIMEOUT and no 429 retries,
+    so a slow or throttled model hands over to the next one quickly.
+    """
+    candidates = model_router.candidates(route)
+    for index, (model, reason) in enumerate(candidates):
+        metrics.record_route(label, model, reason)
+        model_router.attempt(model)
+        if index == len(candidates) - 1:
+            yield model, {}
+        else:
+            yield model, {'timeout': app.config['LLM_FAILOVER_TIMEOUT'], 'max_retries': 0}
+
+def _routed_completion(route, label, system_prompt, user_prompt, **kwargs):
+    """_chat_completion on the model chosen for `route`, failing over on timeouts and 429s.
+
+    `label` (a section key, 'outline' or 'references') names the call in the report trace.
+    """
+    for model, options in _attempts(route, label):
+        try:
+            return _chat_completion(system_prompt, user_prompt, model=model, **kwargs, **options)
+        except Exception as e:
+            if not options or not is_failover_error(e):
+                raise
+
+def _routed_completion_stream(route, label, system_prompt, user_prompt, **kwargs):
+    """_chat_completion_stream with the routing of _routed_completion.
+
+    Failover only happens before the first chunk; text already yielded cannot be taken back.
+    """
+    for model, options in _attempts(route, label):
+        started = False
+        try:
+            for chunk in _chat_completion_stream(system_prompt, user_prompt, model=model, **kwargs, **options):
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not options or not is_failover_error(e):
+                raise
+
+def iter_lines(chunks):
+    """Yield complete lines from a stream of text chunks"""
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split('\n')
+        yield from lines
+    if buffer:
+        yield buffer
+
+# Page setup read from each template section, in EMU
+SECTION_FORMAT_FIELDS = ('page_height', 'page_width', 'left_margin', 'right_margin', 'top_margin', 'bottom_margin')
+
+# Word's built-in styles a template may use instead of naming a report style itself;
+# front matter styles without a Word counterpart only follow a template that names them
+TEMPLATE_STYLE_ALIASES = {
+    'Report Heading': 'Heading 1',
+    'Section Heading': 'Heading 2',
+    'Subheading': 'Heading 3',
+    'Body': 'Body Text',
+    'Body Bullet': 'List Bullet',
+    'Reference': 'Bibliography',
+    'TOC Chapter': 'TOC 1',
+    'TOC Entry': 'TOC 2',
+    'Key Term': 'Strong',
+    'Title Page Title': 'Title',
+    'Contents Heading': 'TOC Heading',
+}
+
+# Schema order of the pPr and rPr children a template style may carry over. Numbering,
+# style links and revision marks refer to parts of the template and are left out.
+_PPR_ORDER = (
+    'keepNext', 'keepLines', 'pageBreakBefore', 'framePr', 'widowControl', 'suppressLineNumbers', 'pBdr',
+    'shd', 'tabs', 'suppressAutoHyphens', 'kinsoku', 'wordWrap', 'overflowPunct', 'topLinePunct',
+    'autoSpaceDE', 'autoSpaceDN', 'bidi', 'adjustRightInd', 'snapToGrid', 'spacing', 'ind',
+    'contextualSpacing', 'mirrorIndents', 'suppressOverlap', 'jc', 'textDirection', 'textAlignment',
+    'textboxTightWrap', 'outlineLvl',
+)
+_RPR_ORDER = (
+    'rFonts', 'b', 'bCs', 'i', 'iCs', 'caps', 'smallCaps', 'strike', 'dstrike', 'outline', 'shadow',
+    'emboss', 'imprint', 'noProof', 'snapToGrid', 'vanish', 'webHidden', 'color', 'spacing', 'w', 'kern',
+    'position', 'sz', 'szCs', 'highlight', 'u', 'effect', 'bdr', 'shd', 'fitText', 'vertAlign', 'rtl',
+    'cs', 'em', 'lang', 'eastAsianLayout', 'specVanish',
+)
+
+def _w(tag):
+    return f'{{{W_NS}}}{tag}'
+
+def _style_properties(styles, style):
+    """{'ppr': {tag: xml}, 'rpr': {tag: xml}} of a style with everything it inherits through basedOn"""
+    from lxml import etree
+
+    chain = []
+    while style is not None and style not in chain:
+        chain.append(style)
+        based_on = style.find(_w('basedOn'))
+        style = styles.get_by_id(based_on.get(_w('val'))) if based_on is not None else None
+    properties = {'ppr': {}, 'rpr': {}}
+    # From the root of the chain down, so each style overrides what it is based on
+    for style in reversed(chain):
+        for key, tag, order in (('ppr', 'pPr', _PPR_ORDER), ('rpr', 'rPr', _RPR_ORDER)):
+            element = style.find(_w(tag))
+            if element is None:
+                continue
+            for child in element:
+                name = etree.QName(child).localname
+                if name in order:
+                    properties[key][name] = etree.tostring(child, encoding='unicode')
+    return properties
+
 def extract_formatting(doc_path):
+    """Page setup and report style formatting of a template .docx (a path or file object).
+
+    Returns a JSON-serializable dict: 'sections' holds each section's page
+    size and margins in EMU, and 'styles' maps report style names to the
+    paragraph and run properties the template gives them. A template style
+    counts if it has the report style's name, or is the Word style in
+    TEMPLATE_STYLE_ALIASES and the template actually uses it.
+    """
+    from docx import Document
+
     doc = Document(doc_path)
     formatting = {
         'sections': [],
         'styles': {}
     }
     for section in doc.sections:
-        section_format = {
-            'page_height': section.page_height,
-            'page_width': section.page_width,
-            'left_margin': section.left_margin,
-            'right_margin': section.right_margin,
-            'top_margin': section.top_margin,
-            'bottom_margin': section.bottom_margin
-        }
+        section_format = {}
+        for field in SECTION_FORMAT_FIELDS:
+            value = getattr(section, field)
+            section_format[field] = None if value is None else int(value)
         formatting['sections'].append(section_format)
-    
+
+    styles = doc.styles.element
+    # Word stores its built-in style names in lower case ("heading 1")
+    by_name = {style.name_val.lower(): style for style in styles.style_lst if style.name_val}
+    used = {element.get(_w('val')) for element in doc.element.body.iter(_w('pStyle'), _w('rStyle'))}
+    for _, _, name, *_ in STYLES:
+        style = by_name.get(name.lower())
+        if style is None:
+            alias = by_name.get(TEMPLATE_STYLE_ALIASES.get(name, '').lower())
+            if alias is not None and alias.styleId in used:
+                style = alias
+        if style is not None:
+            formatting['styles'][name] = _style_properties(styles, style)
     return formatting
 
+def _merge_properties(element, overrides, order):
+    """Replace or add `element`'s children with the template's, keeping schema order"""
+    from docx.oxml import parse_xml
+
+    children = {child.tag: child for child in element}
+    for name, xml in overrides.items():
+        children[_w(name)] = parse_xml(xml)
+    position = {_w(name): index for index, name in enumerate(order)}
+    for child in list(element):
+        element.remove(child)
+    # Anything the order does not know (e.g. pStyle) goes first, as it does in the schema
+    for child in sorted(children.values(), key=lambda child: position.get(child.tag, -1)):
+        element.append(child)
+
+def apply_formatting(doc, formatting):
+    """Apply extract_formatting output to a python-docx document in one pass.
+
+    Report styles take the template's properties over their own, so every
+    paragraph in them changes without touching the paragraphs themselves.
+    Every section takes the page setup of the template section in the same
+    position (or the template's last one), and the table of contents'
+    right tab follows the new text width.
+    """
+    from docx.oxml import OxmlElement
+
+    styles = doc.styles.element
+    for name, properties in formatting.get('styles', {}).items():
+        style = styles.get_by_id(STYLE_IDS.get(name))
+        if style is None:
+            continue
+        for key, tag, order in (('ppr', 'pPr', _PPR_ORDER), ('rpr', 'rPr', _RPR_ORDER)):
+            if not properties.get(key):
+                continue
+            element = style.find(_w(tag))
+            if element is None:
+                element = OxmlElement(f'w:{tag}')
+                style.append(element)
+            _merge_properties(element, properties[key], order)
+
+    template_sections = formatting.get('sections') or []
+    if not template_sections:
+        return
+    for index, section in enumerate(doc.sections):
+        section_format = template_sections[min(index, len(template_sections) - 1)]
+        for field in SECTION_FORMAT_FIELDS:
+            if section_format.get(field) is not None:
+                setattr(section, field, section_format[field])
+
+    section = doc.sections[-1]
+    if None not in (section.page_width, section.left_margin, section.right_margin):
+        # EMU to twips
+        text_width = (section.page_width - section.left_margin - section.right_margin) // 635
+        for name in ('TOC Chapter', 'TOC Entry'):
+            style = styles.get_by_id(STYLE_IDS[name])
+            for tab in style.iter(_w('tab')):
+                if tab.get(_w('val')) == 'right':
+                    tab.set(_w('pos'), str(text_width))
+
 def calculate_chapter_distribution(num_pages):
     """Calculate detailed word counts for each section based on pages"""
     total_words = num_pages * 300
@@ -91,11 +566,8 @@ def calculate_chapter_distribution(num_pages):
     }
     return distribution
 
-def generate_section_content(title, chapter_num, section_num, target_words, context=""):
-    """Generate content for a specific section with word count control"""
-    client = Groq()
-    
-    prompt = f"""Generate section {chapter_num}.{section_num} for "{title}".
+def _section_prompt(title, chapter_num, section_num, target_words, context):
+    return f"""Generate section {chapter_num}.{section_num} for "{title}".
     Structure the content as follows:
     • Use only two-level section numbering ({chapter_num}.{section_num})
     • Use exactly two asterisks (**) for bold text, not four asterisks (****)
@@ -114,85 +586,438 @@ def generate_section_content(title, chapter_num, section_num, target_words, cont
       
     Target length: {target_words} words.
     Previous context: {context}"""
-    
-    # Add delay between API calls to prevent rate limiting
-    time.sleep(2)
-    
-    completion = client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=[
-            {
-                "role": "system",
-                "content": "Generate detailed academic content for a technical project report section. Maintain consistent formatting and technical depth."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        temperature=0.7,
-        max_tokens=2048
+
+def _continuation_prompt(title, chapter_num, section_num, target_words, tail):
+    return f"""Continue section {chapter_num}.{section_num} of the project report on "{title}".
+    The section so far ends with:
+    {tail}
+    Carry on directly from there. Do not repeat the section heading or points already covered.
+    Keep the same formatting: **Subheading Title** for subheadings, • and **Key Term:** for bullet points.
+    Target length: {target_words} words."""
+
+SECTION_SYSTEM_PROMPT = "Generate detailed academic content for a technical project report section. Maintain consistent formatting and technical depth."
+
+def _section_records(prompt, max_tokens, bypass_cache, on_line, route='section', key=None):
+    """LineRecords of one section completion, streamed line by line to `on_line` if given"""
+    if on_line is None:
+        content = _routed_completion(
+            route, key, SECTION_SYSTEM_PROMPT, prompt, max_tokens=max_tokens, bypass_cache=bypass_cache, calibrate=True
+        )
+        return tokenize_section(content)
+
+    records = []
+    chunks = _routed_completion_stream(
+        route, key, SECTION_SYSTEM_PROMPT, prompt, max_tokens=max_tokens, bypass_cache=bypass_cache, calibrate=True
     )
-    
-    return process_content_section(completion.choices[0].message.content)
+    for line in iter_lines(chunks):
+        record = classify_line(line)
+        records.append(record)
+        if record.kind != 'blank':
+            on_line(record)
+    return records
+
+def generate_section_content(title, chapter_num, section_num, target_words, context="", bypass_cache=False, on_line=None, calibration=None):
+    """Generate content for a specific section with word count control and return a Section.
+
+    max_tokens is sized from the calibrated tokens-per-word ratio, taken
+    from `calibration` (a TokenCalibrator) or else token_calibrator. A target
+    too long for one completion of SECTION_MAX_TOKENS is split into equal
+    parts, each after the first continuing from the end of the text so far,
+    but never into more than SECTION_MAX_PARTS; past that, the section
+    comes out shorter than its target.
+
+    With `on_line`, the completion is streamed and the LineRecord of each
+    non-blank line is passed to `on_line` as soon as the line is complete.
+
+    Sections targeting at most LLM_SHORT_SECTION_WORDS words are routed to
+    the fast model.
+    """
+    key = f"{chapter_num}.{section_num}"
+    route = 'short_section' if target_words <= app.config['LLM_SHORT_SECTION_WORDS'] else 'section'
+    calibration = calibration or token_calibrator
+    limit = app.config['SECTION_MAX_TOKENS']
+    parts = max(1, math.ceil(target_words / calibration.words_per_call(limit)))
+    parts = min(parts, max(1, app.config['SECTION_MAX_PARTS']))
+    part_words = math.ceil(target_words / parts)
+    max_tokens = calibration.max_tokens(part_words, limit)
+
+    records = _section_records(
+        _section_prompt(title, chapter_num, section_num, part_words, context), max_tokens, bypass_cache, on_line, route, key
+    )
+    for _ in range(parts - 1):
+        tail = '\n'.join(record.line for record in records).strip()[-500:]
+        prompt = _continuation_prompt(title, chapter_num, section_num, part_words, tail)
+        metrics.record_count('llm_continuations')
+        records.append(BLANK_LINE)
+        records.extend(_section_records(prompt, max_tokens, bypass_cache, on_line, route, key))
+    return Section.from_records(key, records)
+
+CHAPTER_TITLES = {
+    1: "CHAPTER 1. INTRODUCTION",
+    2: "CHAPTER 2. LITERATURE REVIEW/BACKGROUND STUDY",
+    3: "CHAPTER 3. DESIGN FLOW/PROCESS",
+    4: "CHAPTER 4. RESULTS ANALYSIS AND VALIDATION",
+    5: "CHAPTER 5. CONCLUSION AND FUTURE WORK"
+}
+
+@dataclass(slots=True)
+class Section:
+    """A generated section: its key (e.g. '2.3'), line records and cleaned text"""
+    key: str
+    blocks: list
+    text: str
+
+    @classmethod
+    def from_records(cls, key, records):
+        # The cleaned completion, blank lines included, without leading or trailing whitespace
+        text = '\n'.join(record.line for record in records).strip()
+        return cls(key, [record for record in records if record.kind != 'blank'], text)
+
+@dataclass(slots=True)
+class Chapter:
+    number: int
+    title: str
+    sections: list
 
-def generate_project_report(title, num_pages, formatting):
-    """Generate report content in carefully controlled chunks"""
+@dataclass(slots=True)
+class Reference:
+    """One bibliography entry; `text` excludes the [n] marker"""
+    number: int
+    text: str
+
+@dataclass(slots=True)
+class Report:
+    """Everything generate_project_report produces, in document order"""
+    title: str
+    chapters: list
+    references: list
+
+REFERENCES_KEY = 'references'
+OUTLINE_KEY = 'outline'
+
+class ReportCheckpoint:
+    """Sections and references already generated for a job, saved through its reporter"""
+
+    def __init__(self, reporter):
+        self.reporter = reporter
+        self.saved = reporter.checkpoints()
+
+    def section(self, key):
+        data = self.saved.get(key)
+        if data is None:
+            return None
+        return Section(key, [LineRecord(*block) for block in data['blocks']], data['text'])
+
+    def save_section(self, section):
+        self.reporter.save_checkpoint(section.key, {'blocks': section.blocks, 'text': section.text})
+
+    def references(self):
+        data = self.saved.get(REFERENCES_KEY)
+        if data is None:
+            return None
+        return [Reference(number, text) for number, text in data]
+
+    def save_references(self, references):
+        self.reporter.save_checkpoint(REFERENCES_KEY, [(ref.number, ref.text) for ref in references])
+
+    def outline(self):
+        return self.saved.get(OUTLINE_KEY)
+
+    def save_outline(self, outline):
+        self.reporter.save_checkpoint(OUTLINE_KEY, outline)
+
+# Context modes for generate_project_report:
+#   'none'    - sections are independent and generated concurrently
+#   'chained' - each section sees the last 500 chars of the previous one (sequential)
+#   'outline' - one up-front call plans every section, then all are generated
+#               concurrently, each against the shared outline
+# Throttling is left to the shared rate limiter in every mode.
+CONTEXT_MODES = ('none', 'chained', 'outline')
+
+OUTLINE_SYSTEM_PROMPT = "Plan technical project reports. Reply with the outline only, one line per section, no introductory text."
+
+def _outline_prompt(title, plan):
+    chapters = '\n'.join(f"    {CHAPTER_TITLES[chapter_num]}" for chapter_num in sorted(CHAPTER_TITLES))
+    section_keys = ', '.join(section_key for _, section_key, _ in plan)
+    return f"""Write a compact outline for a project report on "{title}".
+    The report has these chapters:
+{chapters}
+    Give exactly one line for each of these sections: {section_keys}
+    Format every line as: <section number> <section title>: <key point>; <key point>; <key point>
+    Use 2-4 short key points per section. Make the sections build on each other without repeating points."""
+
+_OUTLINE_LINE_RE = re.compile(r'^[\s*#•-]*(\d+\.\d+)\.?[\s*]*(.+?)\s*$')
+
+def parse_outline(text):
+    """Map section keys to their outline line from a generated outline"""
+    outline = {}
+    for line in text.split('\n'):
+        match = _OUTLINE_LINE_RE.match(line)
+        if match:
+            outline.setdefault(match.group(1), _ASTERISKS_RE.sub('', match.group(2)).strip())
+    return outline
+
+def generate_outline(title, plan, bypass_cache=False):
+    """One completion planning every section; cached per title like any other completion"""
+    # The prompt depends only on the title (the section keys are the same for every
+    # page count), so repeat reports on a title reuse the cached outline
+    with metrics.timed('outline'):
+        text = _routed_completion(
+            'outline', 'outline', OUTLINE_SYSTEM_PROMPT, _outline_prompt(title, plan), max_tokens=1024, bypass_cache=bypass_cache
+        )
+    return parse_outline(text)
+
+def outline_contexts(outline, plan):
+    """Per-section context: the whole outline plus that section's own points"""
+    summary = '\n'.join(f"{section_key} {line}" for section_key, line in outline.items())
+    contexts = {}
+    for _, section_key, _ in plan:
+        context = f"Report outline:\n{summary}"
+        if outline.get(section_key):
+            context += f"\nThis section covers: {outline[section_key]}"
+        contexts[section_key] = context
+    return contexts
+
+def plan_sections(num_pages):
+    """List (chapter_num, section_key, target_words) in report order"""
     distribution = calculate_chapter_distribution(num_pages)
-    content = []
-    context = ""
-    
-    # Generate content chapter by chapter, section by section
-    for chapter_num in range(1, 6):
-        chapter_content = []
+    plan = []
+    for chapter_num in sorted(distribution):
         chapter_info = distribution[chapter_num]
-        
-        # Add chapter heading
-        chapter_titles = {
-            1: "CHAPTER 1. INTRODUCTION",
-            2: "CHAPTER 2. LITERATURE REVIEW/BACKGROUND STUDY",
-            3: "CHAPTER 3. DESIGN FLOW/PROCESS",
-            4: "CHAPTER 4. RESULTS ANALYSIS AND VALIDATION",
-            5: "CHAPTER 5. CONCLUSION AND FUTURE WORK"
-        }
-        chapter_content.append(chapter_titles[chapter_num])
-        
-        # Generate each section with proper sequential numbering
         section_keys = sorted(chapter_info['sections'].keys(), key=lambda x: float(x))
         for section_key in section_keys:
             proportion = chapter_info['sections'][section_key]
             section_words = int(chapter_info['total_words'] * proportion)
-            
-            # Extract section number from the key (e.g., '1.1' -> 1)
-            section_num = section_key.split('.')[1]
-            
-            section_content = generate_section_content(
-                title,
-                chapter_num,
-                section_num,
-                section_words,
-                context
+            plan.append((chapter_num, section_key, section_words))
+    return plan
+
+def _restore_section(section_key, checkpoint, regenerate, on_progress, budget=None):
+    """The checkpointed Section for `section_key`, unless it is missing or due to be regenerated"""
+    if checkpoint is None or section_key in regenerate:
+        return None
+    section = checkpoint.section(section_key)
+    if section is None:
+        return None
+    if budget is not None:
+        budget.record(section_key, len(section.text.split()))
+    if on_progress:
+        on_progress('restored', section_key, section)
+    return section
+
+def _generate_section(title, chapter_num, section_key, section_words, context, bypass_cache, on_progress, on_line, checkpoint=None, budget=None, calibration=None):
+    """Generate one planned section, reporting when it starts and finishes.
+
+    With a WordBudget, the target comes from the budget instead of the plan
+    and the words actually generated are recorded back into it.
+    """
+    if budget is not None:
+        section_words = budget.target(section_key)
+    if on_progress:
+        on_progress('started', section_key)
+    section_content = generate_section_content(
+        title,
+        chapter_num,
+        section_key.split('.')[1],
+        section_words,
+        context,
+        bypass_cache=bypass_cache,
+        on_line=(lambda record: on_line(section_key, record)) if on_line else None,
+        calibration=calibration
+    )
+    words = len(section_content.text.split())
+    metrics.record_count('section_words', words)
+    if budget is not None:
+        budget.record(section_key, words)
+    if checkpoint is not None:
+        checkpoint.save_section(section_content)
+    if on_progress:
+        on_progress('finished', section_key, section_content)
+    return section_content
+
+def _generate_chained(title, plan, bypass_cache=False, on_progress=None, on_line=None, checkpoint=None, regenerate=(), budget=None, calibration=None):
+    """Generate sections one after another, passing the previous text as context"""
+    results = {}
+    context = ""
+    for chapter_num, section_key, section_words in plan:
+        section_content = _restore_section(section_key, checkpoint, regenerate, on_progress, budget)
+        if section_content is None:
+            section_content = _generate_section(
+                title, chapter_num, section_key, section_words, context,
+                bypass_cache or section_key in regenerate, on_progress, on_line, checkpoint, budget, calibration
             )
-            chapter_content.append(section_content)
-            # Update context for next section
-            context = f"{context}\n{section_content}"[-500:]  # Keep last 500 chars for context
-        
-        content.append("\n\n".join(chapter_content))
-        # Add delay between chapters
-        time.sleep(5)
-    
-    # Generate references
-    references = generate_references(title)
-    
-    # Combine all content
-    full_content = "\n\n".join(content) + "\n\nREFERENCES\n" + references
-    
-    return full_content
+        results[section_key] = section_content
+        # Update context for next section
+        context = f"{context}\n{section_content.text}"[-500:]  # Keep last 500 chars for context
+    return results
+
+def _generate_concurrent(title, plan, concurrency, bypass_cache=False, on_progress=None, on_line=None, checkpoint=None, regenerate=(), executor=None, contexts=None, calibration=None):
+    """Generate independent sections in parallel on a bounded thread pool (or the given executor).
+
+    `contexts` optionally maps section keys to the context each one is generated with.
+    """
+    contexts = contexts or {}
+    results = {}
+    pending = []
+    for chapter_num, section_key, section_words in plan:
+        section_content = _restore_section(section_key, checkpoint, regenerate, on_progress)
+        if section_content is None:
+            pending.append((chapter_num, section_key, section_words))
+        else:
+            results[section_key] = section_content
+    if not pending:
+        return results
+
+    def run_on(pool):
+        futures = {
+            # Each task runs in a copy of the caller's context so it reports into the same trace
+            section_key: pool.submit(
+                contextvars.copy_context().run,
+                _generate_section,
+                title, chapter_num, section_key, section_words, contexts.get(section_key, ""),
+                bypass_cache or section_key in regenerate, on_progress, on_line, checkpoint,
+                calibration=calibration
+            )
+            for chapter_num, section_key, section_words in pending
+        }
+        results.update((section_key, future.result()) for section_key, future in futures.items())
+
+    if executor is not None:
+        run_on(executor)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as own_executor:
+            run_on(own_executor)
+    return results
+
+def generate_project_report(title, num_pages, concurrency=None, context_mode='none', bypass_cache=False, on_progress=None, on_line=None, checkpoint=None, regenerate=(), executor=None):
+    """Generate report content as a Report, fanning independent sections out over a thread pool.
+
+    `on_line(section_key, record)` switches to streamed completions and
+    receives each line's LineRecord as it arrives.
+
+    With a ReportCheckpoint, sections and references it already holds are
+    reused and newly generated ones are saved to it as they finish. Keys in
+    `regenerate` (section keys or REFERENCES_KEY) are generated afresh,
+    bypassing both the checkpoint and the completion cache.
+
+    Passing `executor` runs the sections on that pool instead of a
+    per-report one, so several reports can share one concurrency limit;
+    `concurrency` is then ignored.
+
+    Section targets come from plan_sections. Only chained generation, whose
+    sections run in plan order anyway, rebalances them through a WordBudget
+    as sections come back long or short; concurrent sections keep their
+    planned targets so the same report makes the same requests whatever
+    order they finish in. Completion sizes use a snapshot of token_calibrator
+    taken when the report starts, for the same reason. References are
+    fetched in the background from the start, on `executor` if given.
+    """
+    if context_mode not in CONTEXT_MODES:
+        raise ValueError(f"Unknown context mode: {context_mode}")
+    if concurrency is None:
+        concurrency = app.config['GENERATION_CONCURRENCY']
+
+    plan = plan_sections(num_pages)
+    calibration = token_calibrator.snapshot()
+    metrics.record_count('planned_words', sum(words for _, _, words in plan))
+
+    references = None
+    if checkpoint is not None and REFERENCES_KEY not in regenerate:
+        references = checkpoint.references()
+    references_future = None
+    references_pool = None
+    if references is None:
+        # References depend only on the title, so they are fetched alongside the sections
+        references_pool = executor or ThreadPoolExecutor(max_workers=1)
+        references_future = references_pool.submit(
+            contextvars.copy_context().run,
+            _fetch_references,
+            title, bypass_cache or REFERENCES_KEY in regenerate, checkpoint
+        )
+
+    try:
+        contexts = None
+        if context_mode == 'outline':
+            outline = checkpoint.outline() if checkpoint is not None else None
+            if outline is None:
+                outline = generate_outline(title, plan, bypass_cache)
+                if checkpoint is not None:
+                    checkpoint.save_outline(outline)
+            contexts = outline_contexts(outline, plan)
+
+        if context_mode == 'chained':
+            results = _generate_chained(
+                title, plan, bypass_cache, on_progress, on_line, checkpoint, regenerate, WordBudget(plan), calibration
+            )
+        else:
+            results = _generate_concurrent(
+                title, plan, max(1, concurrency), bypass_cache, on_progress, on_line, checkpoint, regenerate,
+                executor, contexts, calibration
+            )
+        if references_future is not None:
+            references = references_future.result()
+    finally:
+        if references_pool is not None and references_pool is not executor:
+            # Does not wait: if a section failed, the references still finish and are checkpointed
+            references_pool.shutdown(wait=False)
+
+    return assemble_report(title, plan, results, references)
+
+def _fetch_references(title, bypass_cache, checkpoint):
+    references = generate_references(title, bypass_cache)
+    # Saved as soon as they arrive, so a retry after a failed section does not fetch them again
+    if checkpoint is not None:
+        checkpoint.save_references(references)
+    return references
+
+def assemble_report(title, plan, sections, references):
+    """Report from generated Sections keyed by section key, in chapter and section order"""
+    # Reassemble in chapter and section order regardless of completion order
+    chapters = [
+        Chapter(
+            chapter_num,
+            CHAPTER_TITLES[chapter_num],
+            [sections[section_key] for plan_chapter, section_key, _ in plan if plan_chapter == chapter_num]
+        )
+        for chapter_num in sorted(CHAPTER_TITLES)
+    ]
+    return Report(title, chapters, references)
+
+# Cleanup of a references completion: anything before [1] is introductory text
+_REFERENCES_INTRO_RE = re.compile(r'^.*?(?=\[1\])', re.DOTALL)
+_REFERENCE_ENTRY_RE = re.compile(r'\[(\d+)\]\s*(.*?)(?=\[\d+\]|\Z)', re.DOTALL)
+
+def parse_references(text):
+    """Split a references completion into numbered Reference entries"""
+    text = _REFERENCES_INTRO_RE.sub('', text, count=1)
+    return [
+        Reference(int(number), ' '.join(body.split()))
+        for number, body in _REFERENCE_ENTRY_RE.findall(text)
+        if body.strip()
+    ]
+
+def normalize_title(title):
+    """Title with case and spacing folded, so trivially different titles share cached references"""
+    return ' '.join(title.casefold().split())
+
+def _references_cache_key(title):
+    return 'references:' + hashlib.sha256(normalize_title(title).encode('utf-8')).hexdigest()
+
+REFERENCES_SYSTEM_PROMPT = "Generate academic references in IEEE format. Start directly with the numbered references. Do not include any introductory text."
+
+def generate_references(title, bypass_cache=False):
+    """Generate IEEE formatted references relevant to the project topic as a list of References.
+
+    The parsed list is cached per normalized title (see normalize_title)
+    alongside the completion cache; bypass_cache fetches a fresh list and
+    replaces the cached one.
+    """
+    key = _references_cache_key(title)
+    if not bypass_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            metrics.record_count('references_cache_hits')
+            return [Reference(number, text) for number, text in json.loads(cached)]
 
-def generate_references(title):
-    """Generate IEEE formatted references relevant to the project topic"""
-    client = Groq()
-    
     prompt = f"""Generate 15-20 relevant academic references for a project report about "{title}".
     Requirements:
     1. Use IEEE citation format
@@ -207,612 +1032,827 @@ def generate_references(title):
        [1] A. Author, B. Author and C. Author, "Title of paper," Name of Journal, vol. x, no. x, pp. xxx-xxx, Month Year.
     """
     
-    # Add delay to prevent rate limiting
-    time.sleep(2)
-    
-    completion = client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=[
-            {
-                "role": "system",
-                "content": "Generate academic references in IEEE format. Start directly with the numbered references. Do not include any introductory text."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        temperature=0.7,
-        max_tokens=2048
-    )
-    
-    # Process and clean up references
-    references = completion.choices[0].message.content
-    
-    # Remove any introductory text
-    references = re.sub(r'^.*?(?=\[1\])', '', references, flags=re.DOTALL)
-    
-    # Clean up formatting
-    references = re.sub(r'\n{3,}', '\n\n', references)  # Remove extra newlines
-    references = re.sub(r'^\s+', '', references, flags=re.MULTILINE)  # Remove leading spaces
-    references = references.strip()
-    
-    # Add proper spacing between references
-    references = re.sub(r'(\[\d+\])', r'\n\1', references)
-    references = references.strip()
-    
-    # Add proper heading
-    references = "REFERENCES\n\n" + references
-    
+    with metrics.timed('references'):
+        references = parse_references(
+            _routed_completion('references', 'references', REFERENCES_SYSTEM_PROMPT, prompt, bypass_cache=bypass_cache)
+        )
+    # An answer without any numbered entry is not worth keeping
+    if references:
+        llm_cache.put(key, json.dumps([(ref.number, ref.text) for ref in references]))
     return references
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/generate', methods=['POST'])
-def generate_report():
-    title = request.form['title']
-    num_pages = int(request.form['num_pages'])
-    current_month_year = datetime.now().strftime("%b %Y")
-    
-    try:
-        # Create new document
-        doc = Document()
-        
-        # Title Page
-        # "A PROJECT REPORT"
-        title_para = doc.add_paragraph()
-        title_run = title_para.add_run("A PROJECT REPORT")
-        title_run.font.size = Pt(18)
-        title_run.font.name = 'Times New Roman'
-        title_run.bold = True
-        title_para.paragraph_format.line_spacing = 1.5
-        title_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
-        
-        # "Submitted by"
-        submitted_para = doc.add_paragraph()
-        submitted_run = submitted_para.add_run("Submitted by")
-        submitted_run.font.size = Pt(14)
-        submitted_run.font.name = 'Times New Roman'
-        submitted_run.bold = True
-        submitted_run.italic = True
-        submitted_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
-        
-        # Candidate Name
-        name_para = doc.add_paragraph()
-        name_run = name_para.add_run("[NAME OF THE CANDIDATE(S)]")
-        name_run.font.size = Pt(16)
-        name_run.font.name = 'Times New Roman'
-        name_run.bold = True
-        name_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
-        
-        # Degree fulfillment text
-        degree_para = doc.add_paragraph()
-        degree_run = degree_para.add_run("in partial fulfillment for the award of the degree of")
-        degree_run.font.size = Pt(14)
-        degree_run.font.name = 'Times New Roman'
-        degree_run.bold = True
-        degree_run.italic = True
-        degree_para.paragraph_format.line_spacing = 1.5
-        degree_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
-        
-        # Degree Name
-        degree_name_para = doc.add_paragraph()
-        degree_name_run = degree_name_para.add_run("[NAME OF THE DEGREE]")
-        degree_name_run.font.size = Pt(16)
-        degree_name_run.font.name = 'Times New Roman'
-        degree_name_run.bold = True
-        degree_name_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # Branch
-        branch_para = doc.add_paragraph()
-        branch_para.add_run("IN\n").font.size = Pt(14)
-        branch_run = branch_para.add_run("[BRANCH OF STUDY]")
-        branch_run.font.size = Pt(14)
-        branch_run.font.name = 'Times New Roman'
-        branch_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
+def _section_progress(reporter, total_sections):
+    """Adapt generate_project_report section events into job progress and stream events"""
+    active = set()
+    completed = [0]
+    generated = [0]
+    lock = threading.Lock()
 
-        # Add logo
-        logo_para = doc.add_paragraph()
-        logo_run = logo_para.add_run()
-        logo_run.add_picture('static/cu_logo.png', width=Pt(200))
-        logo_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # University and Date
-        univ_para = doc.add_paragraph()
-        univ_run = univ_para.add_run("Chandigarh University")
-        univ_run.font.size = Pt(14)
-        univ_run.font.name = 'Times New Roman'
-        univ_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        date_para = doc.add_paragraph()
-        date_run = date_para.add_run(current_month_year)
-        date_run.font.size = Pt(14)
-        date_run.font.name = 'Times New Roman'
-        date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # Add page break before certificate
+    def on_progress(event, section_key, section=None):
+        with lock:
+            if event == 'started':
+                active.add(section_key)
+            else:
+                active.discard(section_key)
+                completed[0] += 1
+                if event == 'finished':
+                    generated[0] += 1
+            reporter.progress(
+                stage='generating',
+                chapter=int(section_key.split('.')[0]),
+                section=section_key,
+                active_sections=sorted(active, key=float),
+                completed_sections=completed[0],
+                total_sections=total_sections
+            )
+            if event == 'started':
+                return
+            elapsed = time.time() - reporter.started
+            remaining = total_sections - completed[0]
+            reporter.event(
+                'section',
+                section=section_key,
+                words=len(section.text.split()),
+                restored=event == 'restored',
+                completed_sections=completed[0],
+                total_sections=total_sections,
+                elapsed=round(elapsed, 3),
+                # Assumes the remaining sections take as long on average as the ones generated so far
+                estimated_remaining=round(elapsed / generated[0] * remaining, 3) if generated[0] else None,
+                text=section.text
+            )
+
+    return on_progress
+
+def _apply_style(paragraph, style):
+    # Set the style ID directly; assigning by name scans every style in the document per call
+    paragraph._p.get_or_add_pPr().style = STYLE_IDS[style]
+    return paragraph
+
+def _add_chapter_heading(doc, text):
+    return _apply_style(doc.add_paragraph(text), 'Report Heading')
+
+def _detached_paragraph(doc):
+    """Empty paragraph that resolves styles against `doc` but is not yet in its body"""
+    from docx.oxml import OxmlElement
+    from docx.text.paragraph import Paragraph
+
+    return Paragraph(OxmlElement('w:p'), doc._body)
+
+def _add_references(doc, references):
+    """REFERENCES heading followed by one hanging-indent paragraph per entry"""
+    _add_chapter_heading(doc, "REFERENCES")
+    for reference in references:
+        _apply_style(doc.add_paragraph(f"[{reference.number}] {reference.text}"), 'Reference')
+
+def write_report_body(doc, report, prebuilt=None):
+    """Write a Report's chapters and references after the front matter.
+
+    `prebuilt` maps section keys to paragraphs already rendered from a
+    stream; those are placed as-is instead of being rendered from blocks.
+    """
+    # Add page break before first chapter
+    doc.add_page_break()
+    body = doc.element.body
+    for chapter in report.chapters:
+        _add_chapter_heading(doc, chapter.title)
+        for section in chapter.sections:
+            if prebuilt is not None and section.key in prebuilt:
+                for para in prebuilt[section.key]:
+                    body._insert_p(para._p)
+                continue
+            for record in section.blocks:
+                write_line_record(doc, record)
+        # Add page break after completing the chapter
         doc.add_page_break()
-        
-        # Add logo before Bonafide Certificate (same width as first page)
-        logo_para = doc.add_paragraph()
-        logo_run = logo_para.add_run()
-        logo_run.add_picture('static/cu_logo.png', width=Pt(200))
-        logo_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
-        # Bonafide Certificate
-        cert_title = doc.add_paragraph()
-        cert_run = cert_title.add_run("BONAFIDE CERTIFICATE")
-        cert_run.font.size = Pt(16)
-        cert_run.font.name = 'Times New Roman'
-        cert_run.bold = True
-        cert_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph().add_run().add_break()
-        
-        # Certificate content with proper formatting
-        cert_content = doc.add_paragraph()
-        cert_content.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY  # Add justification
-        cert_text = f'Certified that this project report "{title}" is the '
-        cert_run = cert_content.add_run(cert_text)
-        cert_run.font.size = Pt(14)
-        cert_run.font.name = 'Times New Roman'
-        
-        # Add title in bold
-        title_run = cert_content.add_run(title)
-        title_run.font.size = Pt(14)
-        title_run.font.name = 'Times New Roman'
-        title_run.bold = True
-        
-        # Continue text
-        next_text = '" is the '
-        next_run = cert_content.add_run(next_text)
-        next_run.font.size = Pt(14)
-        next_run.font.name = 'Times New Roman'
-        
-        # Add underlined 'bonafide' word
-        bonafide_run = cert_content.add_run("bonafide")
-        bonafide_run.font.size = Pt(14)
-        bonafide_run.font.name = 'Times New Roman'
-        bonafide_run.underline = True
-        
-        # Continue text
-        mid_text = ' work of "'
-        mid_run = cert_content.add_run(mid_text)
-        mid_run.font.size = Pt(14)
-        mid_run.font.name = 'Times New Roman'
-        
-        # Add candidate name in bold
-        name_run = cert_content.add_run("[NAME OF THE CANDIDATE(S)]")
-        name_run.font.size = Pt(14)
-        name_run.font.name = 'Times New Roman'
-        name_run.bold = True
-        
-        # Final text
-        final_text = '" who carried out the project work under my/our supervision.'
-        final_run = cert_content.add_run(final_text)
-        final_run.font.size = Pt(14)
-        final_run.font.name = 'Times New Roman'
-        
-        doc.add_paragraph().add_run().add_break()
-        doc.add_paragraph().add_run().add_break()
-        
-        # Add signatures using tab stops
-        signature_para = doc.add_paragraph()
-        signature_para.paragraph_format.tab_stops.add_tab_stop(Inches(4.5))
-        
-        # Add SIGNATURE text in bold
-        signature_text = "SIGNATURE\tSIGNATURE"
-        signature_run = signature_para.add_run(signature_text)
-        signature_run.font.name = 'Times New Roman'
-        signature_run.font.size = Pt(12)
-        signature_run.bold = True
-        
-        # Add underline for signatures
-        signature_line = doc.add_paragraph()
-        signature_line.paragraph_format.tab_stops.add_tab_stop(Inches(4.5))
-        signature_line.add_run("_____________________\t_____________________")
-        
-        # Add designation in bold
-        designation_para = doc.add_paragraph()
-        designation_para.paragraph_format.tab_stops.add_tab_stop(Inches(4.5))
-        designation_text = "HEAD OF THE DEPARTMENT\tSUPERVISOR"
-        designation_run = designation_para.add_run(designation_text)
-        designation_run.font.name = 'Times New Roman'
-        designation_run.font.size = Pt(12)
-        designation_run.bold = True
-        
-        doc.add_paragraph().add_run().add_break()
-        doc.add_paragraph().add_run().add_break()
-        
-        # Add viva-voce text
-        viva_para = doc.add_paragraph()
-        viva_text = "Submitted for the project "
-        viva_run = viva_para.add_run(viva_text)
-        viva_run.font.size = Pt(12)
-        viva_run.font.name = 'Times New Roman'
-        
-        # Add underlined 'viva-voce'
-        viva_underline = viva_para.add_run("viva-voce")
-        viva_underline.font.size = Pt(12)
-        viva_underline.font.name = 'Times New Roman'
-        viva_underline.underline = True
-        
-        # Add remaining text
-        viva_end = viva_para.add_run(" examination held on _________________")
-        viva_end.font.size = Pt(12)
-        viva_end.font.name = 'Times New Roman'
-        
+    _add_references(doc, report.references)
+
+# Paragraph style for each kind of LineRecord
+RECORD_STYLES = {
+    'heading': 'Section Heading',
+    'subheading': 'Subheading',
+    'bullet': 'Body Bullet',
+    'paragraph': 'Body',
+}
+
+def stream_report(output, title, current_month_year, report, template=None):
+    """Write the front matter and a Report to `output` with the streaming writer"""
+    replacements = [(DATE_PLACEHOLDER, current_month_year), (TITLE_PLACEHOLDER, title)]
+    with DocxStreamWriter(_front_matter_template(template), output, replacements) as writer:
+        writer.page_break()
+        for chapter in report.chapters:
+            writer.paragraph('Report Heading', chapter.title)
+            for section in chapter.sections:
+                for record in section.blocks:
+                    writer.paragraph(RECORD_STYLES[record.kind], record.text, record.key)
+            writer.page_break()
+        writer.paragraph('Report Heading', "REFERENCES")
+        for reference in report.references:
+            writer.paragraph('Reference', f"[{reference.number}] {reference.text}")
+
+# Placeholders filled in per request by new_report_document
+TITLE_PLACEHOLDER = "{{TITLE}}"
+DATE_PLACEHOLDER = "{{DATE}}"
+
+@functools.lru_cache(maxsize=None)
+def _logo_image():
+    """The title page logo, read from disk once per process"""
+    with open(os.path.join(app.static_folder, 'cu_logo.png'), 'rb') as f:
+        return f.read()
+
+def _add_front_matter(doc, title, current_month_year):
+    """Title page, bonafide certificate and table of contents"""
+    from docx.shared import Pt
+
+    def paragraph(style, *runs):
+        # Runs are plain strings or (text, character style) pairs
+        para = doc.add_paragraph(style=style)
+        for run in runs:
+            text, run_style = (run, None) if isinstance(run, str) else run
+            para.add_run(text, run_style)
+        return para
+
+    def logo():
+        doc.add_paragraph(style='Title Page Text').add_run().add_picture(io.BytesIO(_logo_image()), width=Pt(200))
+
+    def blank_line():
         doc.add_paragraph().add_run().add_break()
 
-        
-        # Add examiners using tab stops
-        examiner_para = doc.add_paragraph()
-        examiner_para.paragraph_format.tab_stops.add_tab_stop(Inches(4))
-        
-        # Add underline for examiners
-        examiner_line = doc.add_paragraph()
-        examiner_line.paragraph_format.tab_stops.add_tab_stop(Inches(4))
-        examiner_line.add_run("_____________________\t_____________________")
-        
-        # Add examiner text in bold
-        examiner_text = "INTERNAL EXAMINER\tEXTERNAL EXAMINER"
-        examiner_run = examiner_para.add_run(examiner_text)
-        examiner_run.font.name = 'Times New Roman'
-        examiner_run.font.size = Pt(12)
-        examiner_run.bold = True
-        
-        # Add Table of Contents
-        doc.add_page_break()
-        
-        # Add Table of Contents heading (16pt)
-        toc_heading = doc.add_paragraph()
-        toc_run = toc_heading.add_run("TABLE OF CONTENTS")
-        toc_run.font.size = Pt(16)  # Main TOC heading is 16pt
-        toc_run.font.name = 'Times New Roman'
-        toc_run.bold = True
-        toc_run.underline = True
-        toc_heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph()  # Add space after heading
-        
-        # Add Lists with proper spacing and tab stops (14pt)
-        for list_title, page_num in [
-            ("List of Figures", 7),
-            ("List of Tables", 8),
-            ("List of Standards", 9)
-        ]:
-            para = doc.add_paragraph()
-            para.paragraph_format.tab_stops.add_tab_stop(Inches(6.5), WD_TAB_ALIGNMENT.RIGHT, WD_TAB_LEADER.DOTS)
-            
-            # Main list titles are 14pt
-            list_run = para.add_run(list_title)
-            list_run.font.name = 'Times New Roman'
-            list_run.font.size = Pt(12)
-            para.add_run(f'\t{page_num}')
-        
-        doc.add_paragraph()  # Add space before chapters
-        
-        # Add chapters and their sections
-        chapters = {
-            "CHAPTER 1. INTRODUCTION": {
-                "sections": [
-                    "1.1. Identification of Client/Need/ Relevant Contemporary issue",
-                    "1.2. Identification of Problem",
-                    "1.3. Identification of Tasks",
-                    "1.4. Timeline",
-                    "1.5. Organization of the Report"
-                ],
-                "page": 11
-            },
-            "CHAPTER 2. LITERATURE REVIEW/BACKGROUND STUDY": {
-                "sections": [
-                    "2.1. Timeline of the reported problem",
-                    "2.2. Existing solutions",
-                    "2.3. Bibliometric analysis",
-                    "2.4. Review Summary",
-                    "2.5. Problem Definition",
-                    "2.6. Goals/Objectives"
-                ],
-                "page": 12
-            },
-            "CHAPTER 3. DESIGN FLOW/PROCESS": {
-                "sections": [
-                    "3.1. Evaluation & Selection of Specifications/Features",
-                    "3.2. Design Constraints",
-                    "3.3. Analysis of Features and finalization subject to constraints",
-                    "3.4. Design Flow",
-                    "3.5. Design selection",
-                    "3.6. Implementation plan methodology"
-                ],
-                "page": 13
-            },
-            "CHAPTER 4. RESULTS ANALYSIS AND VALIDATION": {
-                "sections": [
-                    "4.1. Implementation of solution"
-                ],
-                "page": 14
-            },
-            "CHAPTER 5. CONCLUSION AND FUTURE WORK": {
-                "sections": [
-                    "5.1. Conclusion",
-                    "5.2. Future work"
-                ],
-                "page": 15
-            }
+    # Title Page
+    paragraph('Title Page Title', "A PROJECT REPORT")
+    blank_line()
+    paragraph('Title Page Emphasis', "Submitted by")
+    blank_line()
+    paragraph('Title Page Name', "[NAME OF THE CANDIDATE(S)]")
+    blank_line()
+    paragraph('Title Page Emphasis', "in partial fulfillment for the award of the degree of")
+    blank_line()
+    paragraph('Title Page Name', "[NAME OF THE DEGREE]")
+    paragraph('Title Page Text', "IN\n", "[BRANCH OF STUDY]")
+    blank_line()
+    logo()
+    paragraph('Title Page Text', "Chandigarh University")
+    paragraph('Title Page Text', current_month_year)
+
+    # Bonafide Certificate, under the same logo
+    doc.add_page_break()
+    logo()
+    blank_line()
+    paragraph('Certificate Heading', "BONAFIDE CERTIFICATE")
+    blank_line()
+    paragraph(
+        'Certificate Body',
+        f'Certified that this project report "{title}" is the ',
+        (title, 'Key Term'),
+        '" is the ',
+        ("bonafide", 'Underlined Term'),
+        ' work of "',
+        ("[NAME OF THE CANDIDATE(S)]", 'Key Term'),
+        '" who carried out the project work under my/our supervision.'
+    )
+    blank_line()
+    blank_line()
+    paragraph('Signature Block', "SIGNATURE\tSIGNATURE")
+    paragraph('Signature Line', "_____________________\t_____________________")
+    paragraph('Signature Block', "HEAD OF THE DEPARTMENT\tSUPERVISOR")
+    blank_line()
+    blank_line()
+    paragraph(
+        'Certificate Note',
+        "Submitted for the project ",
+        ("viva-voce", 'Underlined Term'),
+        " examination held on _________________"
+    )
+    blank_line()
+    paragraph('Signature Block', "INTERNAL EXAMINER\tEXTERNAL EXAMINER")
+    paragraph('Signature Line', "_____________________\t_____________________")
+
+    # Table of Contents
+    doc.add_page_break()
+    paragraph('Contents Heading', "TABLE OF CONTENTS")
+    doc.add_paragraph()  # Add space after heading
+    
+    # Add Lists with proper spacing and tab stops (14pt)
+    for list_title, page_num in [
+        ("List of Figures", 7),
+        ("List of Tables", 8),
+        ("List of Standards", 9)
+    ]:
+        para = doc.add_paragraph(list_title, style='TOC Entry')
+        para.add_run(f'\t{page_num}')
+    
+    doc.add_paragraph()  # Add space before chapters
+    
+    # Add chapters and their sections
+    chapters = {
+        "CHAPTER 1. INTRODUCTION": {
+            "sections": [
+                "1.1. Identification of Client/Need/ Relevant Contemporary issue",
+                "1.2. Identification of Problem",
+                "1.3. Identification of Tasks",
+                "1.4. Timeline",
+                "1.5. Organization of the Report"
+            ],
+            "page": 11
+        },
+        "CHAPTER 2. LITERATURE REVIEW/BACKGROUND STUDY": {
+            "sections": [
+                "2.1. Timeline of the reported problem",
+                "2.2. Existing solutions",
+                "2.3. Bibliometric analysis",
+                "2.4. Review Summary",
+                "2.5. Problem Definition",
+                "2.6. Goals/Objectives"
+            ],
+            "page": 12
+        },
+        "CHAPTER 3. DESIGN FLOW/PROCESS": {
+            "sections": [
+                "3.1. Evaluation & Selection of Specifications/Features",
+                "3.2. Design Constraints",
+                "3.3. Analysis of Features and finalization subject to constraints",
+                "3.4. Design Flow",
+                "3.5. Design selection",
+                "3.6. Implementation plan methodology"
+            ],
+            "page": 13
+        },
+        "CHAPTER 4. RESULTS ANALYSIS AND VALIDATION": {
+            "sections": [
+                "4.1. Implementation of solution"
+            ],
+            "page": 14
+        },
+        "CHAPTER 5. CONCLUSION AND FUTURE WORK": {
+            "sections": [
+                "5.1. Conclusion",
+                "5.2. Future work"
+            ],
+            "page": 15
         }
-        
-        # Add chapters with proper tab stops
-        for chapter, details in chapters.items():
-            # Add chapter heading (14pt)
-            chapter_para = doc.add_paragraph()
-            chapter_para.paragraph_format.tab_stops.add_tab_stop(Inches(6.5), WD_TAB_ALIGNMENT.RIGHT, WD_TAB_LEADER.DOTS)
-            
-            chapter_run = chapter_para.add_run(chapter)
-            chapter_run.font.name = 'Times New Roman'
-            chapter_run.font.size = Pt(14)  # Chapter headings are 14pt
-            chapter_run.bold = True
-            chapter_para.add_run(f'\t{details["page"]}')
-
-            # Add sections with proper indentation and tab stops (12pt)
-            for section in details["sections"]:
-                section_para = doc.add_paragraph()
-                section_para.paragraph_format.tab_stops.add_tab_stop(Inches(6.5), WD_TAB_ALIGNMENT.RIGHT, WD_TAB_LEADER.DOTS)
-                
-                section_run = section_para.add_run(section)
-                section_run.font.name = 'Times New Roman'
-                section_run.font.size = Pt(12)  # Subheadings are 12pt
-                section_para.add_run(f'\t{details["page"]}')
-
-            doc.add_paragraph()  # Add space between chapters
-        
-        # Add final sections (REFERENCES, APPENDIX, USER MANUAL)
-        final_sections = [
-            ("REFERENCES", 16, []),
-            ("APPENDIX", 17, [
-                "1. Plagiarism Report",
-                "2. Design Checklist"
-            ]),
-            ("USER MANUAL", 18, [])
-        ]
-        
-        for section, page_num, subsections in final_sections:
-            # Add main section (14pt)
-            section_para = doc.add_paragraph()
-            section_para.paragraph_format.tab_stops.add_tab_stop(Inches(6.5), WD_TAB_ALIGNMENT.RIGHT, WD_TAB_LEADER.DOTS)
-            
-            section_run = section_para.add_run(section)
-            section_run.font.name = 'Times New Roman'
-            section_run.font.size = Pt(14)  # Main sections are 14pt
-            section_run.bold = True
-            section_para.add_run(f'\t{page_num}')
-            
-            # Add subsections if any (12pt)
-            for subsection in subsections:
-                subsection_para = doc.add_paragraph()
-                subsection_para.paragraph_format.tab_stops.add_tab_stop(Inches(6.5), WD_TAB_ALIGNMENT.RIGHT, WD_TAB_LEADER.DOTS)
-                
-                subsection_run = subsection_para.add_run(subsection)
-                subsection_run.font.name = 'Times New Roman'
-                subsection_run.font.size = Pt(12)  # Subsections are 12pt
-                subsection_para.add_run(f'\t{page_num}')
-
-            doc.add_paragraph()  # Add space after each main section
-        
-        # Remove the page break and directly start processing content
-        # Generate content using AI
-        content = generate_project_report(title, num_pages, {})
-        
-        # Process and add the content with proper formatting
-        sections = content.split('\n\n')
-        current_chapter = []
-        
-        # Skip any introductory text
-        start_index = 0
-        for i, section in enumerate(sections):
-            if section.strip().startswith('CHAPTER'):
-                start_index = i
-                break
-        
-        # Add page break before first chapter
-        doc.add_page_break()
-        
-        # Process all sections including the last chapter and references
-        for i, section in enumerate(sections[start_index:]):
-            if section.strip():
-                # If we encounter a new chapter or references
-                if section.strip().startswith('CHAPTER') or section.strip().startswith('REFERENCES'):
-                    # If we have content from previous chapter, add it first
-                    if current_chapter:
-                        # Add all content from current chapter
-                        for chapter_section in current_chapter:
-                            # Handle chapter headings
-                            if chapter_section.startswith('CHAPTER'):
-                                para = doc.add_paragraph()
-                                run = para.add_run(chapter_section)
-                                run.font.size = Pt(16)
-                                run.bold = True
-                                run.font.name = 'Times New Roman'
-                                para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                para.paragraph_format.line_spacing = 1.5
-                            else:
-                                lines = chapter_section.split('\n')
-                                for line in lines:
-                                    line = line.strip()
-                                    if line:
-                                        para = add_formatted_content(doc, line)
-                                        para.paragraph_format.line_spacing = 1.5
-                        
-                        # Add page break after completing the chapter (except for references)
-                        if not current_chapter[0].strip().startswith('REFERENCES'):
-                            doc.add_page_break()
-                        current_chapter = []
-                    
-                    # Start new chapter or references
-                    current_chapter.append(section)
-                else:
-                    # Add section to current chapter
-                    current_chapter.append(section)
-        
-        # Process the last chapter/section if any content remains
-        if current_chapter:
-            for chapter_section in current_chapter:
-                if chapter_section.strip().startswith('REFERENCES'):
-                    para = doc.add_paragraph()
-                    run = para.add_run("REFERENCES")
-                    run.font.size = Pt(16)
-                    run.bold = True
-                    run.font.name = 'Times New Roman'
-                    para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    para.paragraph_format.line_spacing = 1.5
-                    
-                    # Add references content with proper formatting
-                    ref_content = chapter_section.replace("REFERENCES", "").strip()
-                    if ref_content:
-                        # Split references into individual entries
-                        ref_entries = re.split(r'(\[\d+\])', ref_content)
-                        for entry in ref_entries:
-                            if entry.strip():
-                                ref_para = doc.add_paragraph()
-                                ref_run = ref_para.add_run(entry.strip())
-                                ref_run.font.size = Pt(12)
-                                ref_run.font.name = 'Times New Roman'
-                                ref_para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                                ref_para.paragraph_format.line_spacing = 1.5
-                                ref_para.paragraph_format.left_indent = Inches(0.5)  # Add left indentation
-                                ref_para.paragraph_format.first_line_indent = Inches(-0.5)  # Hanging indent
-                else:
-                    para = doc.add_paragraph()
-                    run = para.add_run(chapter_section.strip())
-                    run.font.size = Pt(12)
-                    run.font.name = 'Times New Roman'
-                    para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                    para.paragraph_format.line_spacing = 1.5
-
-        # Save the document after all content has been processed
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{secure_filename(title)}.docx")
-        doc.save(output_path)
-        
-        return send_file(output_path, as_attachment=True)
-        
-    except Exception as e:
-        return str(e), 500
+    }
+    
+    # Add chapters with proper tab stops
+    for chapter, details in chapters.items():
+        # Add chapter heading (14pt)
+        chapter_para = doc.add_paragraph(chapter, style='TOC Chapter')
+        chapter_para.add_run(f'\t{details["page"]}')
 
-def process_content_section(content):
-    """Clean and format section content to maintain consistent styling"""
-    processed_lines = []
+        # Add sections with proper indentation and tab stops (12pt)
+        for section in details["sections"]:
+            section_para = doc.add_paragraph(section, style='TOC Entry')
+            section_para.add_run(f'\t{details["page"]}')
+
+        doc.add_paragraph()  # Add space between chapters
     
-    for line in content.split('\n'):
-        # Skip empty lines
-        if not line or len(line.strip()) == 0:
-            processed_lines.append('')
-            continue
-            
-        # Remove all asterisks from section numbers and subheadings
-        if re.match(r'^[\*]+\d+\.\d+\s+', line) or re.match(r'^\d+\.\d+\s+', line):
-            line = re.sub(r'^[\*]+|\*+$', '', line)
-            processed_lines.append(line)
-            continue
-            
-        # Remove asterisks from subheadings (including those with "and", "&", etc.)
-        if (re.match(r'^[\*]+[A-Z][A-Za-z\s]+(and|&)?[A-Za-z\s]+', line) or 
-            (len(line.split()) <= 4 and len(line.lstrip('*')) > 0 and line.lstrip('*')[0].isupper())):
-            line = re.sub(r'^[\*]+|\*+$', '', line)
-            processed_lines.append(line)
-            continue
-            
-        # Handle bullet points and clean up asterisks after colons
-        if line.strip().startswith('•'):
-            # Remove extra asterisks after colons
-            line = re.sub(r':\s*\*+', ':', line)
-            # Clean up any remaining multiple asterisks
-            line = re.sub(r'\*{2,}', '', line)
-            processed_lines.append(line)
-            continue
-            
-        # For all other lines, remove all asterisks
-        line = re.sub(r'\*+', '', line)
-        processed_lines.append(line)
+    # Add final sections (REFERENCES, APPENDIX, USER MANUAL)
+    final_sections = [
+        ("REFERENCES", 16, []),
+        ("APPENDIX", 17, [
+            "1. Plagiarism Report",
+            "2. Design Checklist"
+        ]),
+        ("USER MANUAL", 18, [])
+    ]
     
-    content = '\n'.join(processed_lines)
-    content = content.strip()
-    return content
+    for section, page_num, subsections in final_sections:
+        # Add main section (14pt)
+        section_para = doc.add_paragraph(section, style='TOC Chapter')
+        section_para.add_run(f'\t{page_num}')
+        
+        # Add subsections if any (12pt)
+        for subsection in subsections:
+            subsection_para = doc.add_paragraph(subsection, style='TOC Entry')
+            subsection_para.add_run(f'\t{page_num}')
 
-def add_formatted_content(doc, line, content_para=None):
-    """Helper function to handle text formatting"""
-    if content_para is None:
-        content_para = doc.add_paragraph()
+        doc.add_paragraph()  # Add space after each main section
+
+def add_report_styles(doc):
+    """Define the named report styles in a python-docx document if it lacks them"""
+    from docx.oxml import parse_xml
+
+    styles = doc.styles.element
+    for style in STYLES:
+        if styles.get_by_id(style[1]) is None:
+            styles.append(parse_xml(style_element_xml(style)))
+
+@functools.lru_cache(maxsize=32)
+def _front_matter_template(template=None):
+    """Front matter rendered once with placeholder title and date, as .docx bytes.
+
+    `template` is the ID of an uploaded formatting template (see
+    formatting_cache); its formatting is applied to the styles and page
+    setup before anything is added, and the result cached per template.
+    """
+    from docx import Document
+
+    formatting = None
+    if template is not None:
+        formatting = formatting_cache.get(template)
+        if formatting is None:
+            raise ValueError(f"Unknown formatting template: {template}")
+    doc = Document()
+    add_report_styles(doc)
+    if formatting is not None:
+        apply_formatting(doc, formatting)
+    _add_front_matter(doc, TITLE_PLACEHOLDER, DATE_PLACEHOLDER)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def preload():
+    """Build what every report needs before a server forks its workers.
+
+    Called once by wsgi.py in the master process, so the front matter, the
+    logo and the page template are loaded once and shared by every worker
+    instead of being rebuilt on each worker's first request. Nothing here
+    opens a connection or starts a thread.
+    """
+    # Imported lazily everywhere else; here they are paid for once, before the fork
+    import groq  # noqa: F401
+    import httpx  # noqa: F401
+    _logo_image()
+    _front_matter_template()
+    app.jinja_env.get_template('index.html')
+
+def new_report_document(title, current_month_year, template=None):
+    """Clone the cached front matter template and fill in the title and date"""
+    from docx import Document
+
+    doc = Document(io.BytesIO(_front_matter_template(template)))
+    for paragraph in doc.paragraphs:
+        for run in paragraph.runs:
+            text = run.text
+            if '{{' not in text:
+                continue
+            # Date first, so a title that happens to contain the date placeholder is left alone
+            run.text = text.replace(DATE_PLACEHOLDER, current_month_year).replace(TITLE_PLACEHOLDER, title)
+    return doc
+
+def build_report(params, reporter, executor=None, output_path=None):
+    """Generate the report described by a job's params and return the saved .docx path.
+
+    The document goes to `output_path` if given, otherwise into the artifact
+    store; with ARTIFACT_STORAGE=none it is not written at all and None is
+    returned. `executor` is passed through to generate_project_report.
+    """
+    with metrics.trace() as report_trace:
+        output_path = _build_report(params, reporter, executor, output_path)
+    # Kept with the job so the download response can carry it
+    reporter.progress(trace=report_trace.summary())
+    return output_path
+
+def _report_date(params):
+    # Stored with the job so a document rebuilt later carries the same date
+    return params.get('date') or datetime.now().strftime("%b %Y")
+
+def _build_report(params, reporter, executor=None, output_path=None):
+    title = params['title']
+    num_pages = params['num_pages']
+    context_mode = params.get('context_mode', 'none')
+    bypass_cache = params.get('bypass_cache', False)
+    stream = params.get('stream', False)
+    template = params.get('template')
+    use_python_docx = app.config['DOCX_WRITER'] == 'python-docx'
+    current_month_year = _report_date(params)
+    reporter.progress(stage='front_matter')
     
-    # Skip empty lines
-    if not line or len(line.strip()) == 0:
-        return content_para
+    # Create new document from the prebuilt front matter
+    with metrics.timed('front_matter'):
+        if use_python_docx:
+            doc = new_report_document(title, current_month_year, template)
+        else:
+            _front_matter_template(template)
+    
+    # Remove the page break and directly start processing content
+    # Generate content using AI
+    plan = plan_sections(num_pages)
+    streamed = {}
+    on_line = None
+    if stream:
+        def on_line(section_key, record):
+            if use_python_docx:
+                # Build the paragraph while the rest of the completion is still arriving
+                streamed.setdefault(section_key, []).append(
+                    write_line_record(doc, record, _detached_paragraph(doc))
+                )
+            reporter.event('line', section=section_key, text=record.line.strip())
+
+    with metrics.timed('generation'):
+        report = generate_project_report(
+            title,
+            num_pages,
+            context_mode=context_mode,
+            bypass_cache=bypass_cache,
+            on_progress=_section_progress(reporter, len(plan)),
+            on_line=on_line,
+            checkpoint=ReportCheckpoint(reporter),
+            regenerate=params.get('regenerate', ()),
+            executor=executor
+        )
+    if output_path is None and app.config['ARTIFACT_STORAGE'] == 'none':
+        # Rendered from the job's checkpoints when it is downloaded
+        return None
+
+    # Written under a temporary name and renamed, so readers never see a partial file
+    if output_path is None:
+        partial_path = artifact_store.temp_path()
+    else:
+        partial_path = f"{output_path}.{uuid.uuid4().hex}.partial"
+    try:
+        if not use_python_docx:
+            # Assembly and saving are one pass straight into the zip
+            reporter.progress(stage='saving')
+            with metrics.timed('docx_assembly'):
+                stream_report(partial_path, title, current_month_year, report, template)
+        else:
+            reporter.progress(stage='assembling')
+
+            with metrics.timed('docx_assembly'):
+                # Streamed paragraphs already exist and are only placed in order
+                write_report_body(doc, report, streamed if stream else None)
+
+            # Save the document after all content has been processed
+            reporter.progress(stage='saving')
+            with metrics.timed('docx_save'):
+                doc.save(partial_path)
+        if output_path is None:
+            # Content-addressed, so concurrent jobs never overwrite each other's files
+            return artifact_store.commit(partial_path)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
     
+    return output_path
+
+def render_from_checkpoints(job, output):
+    """Write a finished job's document to `output` from its checkpoints alone.
+
+    Returns False, without writing, if any section or the references are
+    missing, so no LLM call is ever made here.
+    """
+    params = job['params']
+    checkpoint = ReportCheckpoint(JobReporter(job_queue.store, job['id']))
+    plan = plan_sections(params['num_pages'])
+    sections = {section_key: checkpoint.section(section_key) for _, section_key, _ in plan}
+    references = checkpoint.references()
+    if references is None or None in sections.values():
+        return False
+    report = assemble_report(params['title'], plan, sections, references)
+    date = params.get('date') or datetime.fromtimestamp(job['created']).strftime("%b %Y")
+    stream_report(output, params['title'], date, report, params.get('template'))
+    return True
+
+job_queue = JobQueue(JobStore(app.config['JOB_DB_PATH']), build_report, app.config['JOB_WORKERS'], app.config['JOB_TTL'])
+# Jobs left behind by a process that crashed or was killed can be retried from here on
+job_queue.recover()
+
+def _read_template(upload):
+    """(template ID, formatting) for an uploaded .docx, parsed only if its content is new"""
+    def parse(data):
+        return extract_formatting(io.BytesIO(data))
+    return formatting_cache.get_or_parse(upload.read(), parse)
+
+def _template_summary(template_id, formatting):
+    return {
+        'template_id': template_id,
+        'sections': len(formatting['sections']),
+        'styles': sorted(formatting['styles']),
+    }
+
+@app.route('/templates', methods=['POST'])
+def upload_template():
+    """Register a formatting template .docx; its template_id can then be passed to /generate"""
+    upload = request.files.get('template')
+    if upload is None or not upload.filename:
+        return jsonify(error="No template file uploaded"), 400
+    try:
+        template_id, formatting = _read_template(upload)
+    except Exception:
+        return jsonify(error="Template is not a readable .docx file"), 400
+    return jsonify(_template_summary(template_id, formatting)), 201
+
+# Page counts the form accepts (see the num_pages input in index.html)
+MIN_PAGES = 1
+MAX_PAGES = 100
+
+@app.route('/generate', methods=['POST'])
+def generate_report():
+    title = request.form['title']
+    if not is_xml_safe(title):
+        return jsonify(error="Title contains control characters"), 400
+    try:
+        num_pages = int(request.form['num_pages'])
+    except ValueError:
+        num_pages = None
+    if num_pages is None or not MIN_PAGES <= num_pages <= MAX_PAGES:
+        return jsonify(error=f"num_pages must be a whole number from {MIN_PAGES} to {MAX_PAGES}"), 400
+    context_mode = request.form.get('context_mode', 'none')
+    bypass_cache = request.form.get('bypass_cache') in ('1', 'on', 'true')
+    stream = request.form.get('stream') in ('1', 'on', 'true')
+    if context_mode not in CONTEXT_MODES:
+        return jsonify(error=f"Unknown context mode: {context_mode}"), 400
+
+    # A formatting template comes either as an upload or as the ID of one uploaded before
+    template = request.form.get('template_id') or None
+    upload = request.files.get('template')
+    if upload is not None and upload.filename:
+        try:
+            template, _ = _read_template(upload)
+        except Exception:
+            return jsonify(error="Template is not a readable .docx file"), 400
+    elif template is not None and formatting_cache.get(template) is None:
+        return jsonify(error=f"Unknown template: {template}"), 400
+
+    # Double submits and classmates asking for the same report share one job;
+    # `stream` only changes which events are logged, not the document
+    dedup_key = json.dumps([title, num_pages, context_mode, bypass_cache, template])
+    job_id, created = job_queue.submit_once({
+        'title': title,
+        'num_pages': num_pages,
+        'context_mode': context_mode,
+        'bypass_cache': bypass_cache,
+        'stream': stream,
+        'template': template,
+        'date': datetime.now().strftime("%b %Y")
+    }, dedup_key, app.config['JOB_DEDUP_STALE_SECONDS'])
+    return jsonify(
+        job_id=job_id,
+        deduplicated=not created,
+        status_url=url_for('job_status', job_id=job_id),
+        events_url=url_for('job_events', job_id=job_id),
+        download_url=url_for('download_report', job_id=job_id)
+    ), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(
+        job_id=job['id'],
+        status=job['status'],
+        title=job['params']['title'],
+        progress=job['progress'],
+        error=job['error'],
+        download_url=url_for('download_report', job_id=job_id) if job['status'] == DONE else None
+    )
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events stream of a job's progress; ?text=1 includes section and line text.
+
+    Each response ends after EVENT_STREAM_SECONDS; EventSource then
+    reconnects with Last-Event-ID and picks up where it left off. Once the
+    job has finished and every event was sent, the answer is 204, which
+    tells EventSource to stop reconnecting.
+    """
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    include_text = request.args.get('text') in ('1', 'true')
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        # Not an ID this endpoint sent; replay from the start
+        last_id = 0
+    if job['status'] in (DONE, FAILED) and last_id and not job_queue.store.events_since(job_id, last_id):
+        return '', 204
+    deadline = time.monotonic() + app.config['EVENT_STREAM_SECONDS']
+
+    def stream():
+        nonlocal last_id
+        idle = 0.0
+        # Reconnect quickly after a stream ends on its deadline
+        yield "retry: 1000\n\n"
+        while time.monotonic() < deadline:
+            events = job_queue.store.events_since(job_id, last_id)
+            finished = False
+            for event_id, kind, data in events:
+                last_id = event_id
+                if kind == 'status':
+                    # A retried job logs further status events after its first DONE/FAILED
+                    finished = data['status'] in (DONE, FAILED)
+                if not include_text:
+                    if kind == 'line':
+                        continue
+                    data.pop('text', None)
+                yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+            if finished:
+                return
+            if events:
+                idle = 0.0
+            elif idle >= 15:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(0.5)
+            idle += 0.5
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _resubmit(job_id, regenerate):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    params = dict(job['params'], regenerate=regenerate)
+    if not job_queue.resubmit(job_id, params):
+        return jsonify(error="Job is still in progress", status=job['status']), 409
+    return jsonify(
+        job_id=job_id,
+        status=QUEUED,
+        regenerate=regenerate,
+        status_url=url_for('job_status', job_id=job_id),
+        events_url=url_for('job_events', job_id=job_id),
+        download_url=url_for('download_report', job_id=job_id)
+    ), 202
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """Run a failed or finished job again, generating only the sections it has not checkpointed"""
+    return _resubmit(job_id, [])
+
+@app.route('/jobs/<job_id>/sections/<section_key>/regenerate', methods=['POST'])
+def regenerate_section(job_id, section_key):
+    """Regenerate one section (e.g. 2.3, or 'references') and rebuild the document from checkpoints"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    section_keys = {key for _, key, _ in plan_sections(job['params']['num_pages'])}
+    if section_key != REFERENCES_KEY and section_key not in section_keys:
+        return jsonify(error=f"Unknown section: {section_key}"), 404
+    return _resubmit(job_id, [section_key])
+
+@app.route('/jobs/<job_id>/download')
+def download_report(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    if job['status'] != DONE:
+        return jsonify(error="Report is not ready", status=job['status']), 409
+    download_name = f"{secure_filename(job['params']['title']) or 'report'}.docx"
+    path = artifact_store.open_path(job['result_path'])
+    if path is not None:
+        # The file name is its content hash, which makes a strong ETag for conditional requests
+        response = send_file(
+            path,
+            as_attachment=True,
+            download_name=download_name,
+            etag=artifact_store.digest(path),
+            conditional=True
+        )
+    elif job['result_path'] and artifact_store.digest(job['result_path']) is None and os.path.exists(job['result_path']):
+        # Saved by name before the artifact store existed
+        response = send_file(job['result_path'], as_attachment=True, download_name=download_name)
+    else:
+        # Not kept on disk, or evicted since: rebuild it in memory from the checkpoints
+        buffer = io.BytesIO()
+        if not render_from_checkpoints(job, buffer):
+            return jsonify(
+                error="Report is no longer available; retry the job to rebuild it",
+                retry_url=url_for('retry_job', job_id=job_id)
+            ), 410
+        data = buffer.getvalue()
+        buffer.seek(0)
+        response = send_file(
+            buffer,
+            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            as_attachment=True,
+            download_name=download_name,
+            etag=hashlib.sha256(data).hexdigest(),
+            conditional=True
+        )
+    summary = job['progress'].get('trace')
+    if summary and app.config['REPORT_TRACE_HEADERS']:
+        response.headers['Server-Timing'] = metrics.server_timing(summary)
+        response.headers['X-Report-Trace'] = json.dumps(summary, separators=(',', ':'))
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """Liveness and load of this worker, plus job counts across all workers"""
+    load = job_queue.load()
+    return jsonify(
+        status='ok',
+        pid=os.getpid(),
+        worker=load,
+        busy=round(load['running'] / max(1, load['workers']), 2),
+        jobs=job_queue.store.counts()
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of the metrics of every worker process.
+
+    Other workers' values are as of their last publish, at most
+    METRICS_PUBLISH_SECONDS old.
+    """
+    return Response(metrics_store.render(metrics.registry), mimetype='text/plain; version=0.0.4')
+
+# One record per line of generated content:
+#   kind - 'blank', 'heading', 'subheading', 'bullet' or 'paragraph'
+#   line - the line with its asterisk markup cleaned, as kept in Section.text
+#   text - what the docx writer renders (for bullets, the part after the key)
+#   key  - a bullet's "Key Term:" prefix, or None
+LineRecord = namedtuple('LineRecord', 'kind line text key')
+
+BLANK_LINE = LineRecord('blank', '', '', None)
+
+# Cleanup patterns for raw LLM output
+_NUMBERED_RE = re.compile(r'^\**\d+\.\d+\s+')
+_STARRED_SUBHEADING_RE = re.compile(r'^[\*]+[A-Z][A-Za-z\s]+(and|&)?[A-Za-z\s]+')
+_EDGE_ASTERISKS_RE = re.compile(r'^[\*]+|\*+$')
+_COLON_ASTERISKS_RE = re.compile(r':\s*\*+')
+_DOUBLE_ASTERISKS_RE = re.compile(r'\*{2,}')
+_ASTERISKS_RE = re.compile(r'\*+')
+
+# Layout patterns for cleaned lines
+_SECTION_HEADING_RE = re.compile(r'^\d+\.\d+\s+')
+_SUBHEADING_RE = re.compile(r'^[A-Z][A-Za-z\s]+(and|&)?[A-Za-z\s]+')
+
+def _clean_line(line):
+    # Remove all asterisks from section numbers and subheadings
+    if _NUMBERED_RE.match(line):
+        return _EDGE_ASTERISKS_RE.sub('', line)
+
+    # Remove asterisks from subheadings (including those with "and", "&", etc.)
+    if (_STARRED_SUBHEADING_RE.match(line) or
+        (len(line.split()) <= 4 and len(line.lstrip('*')) > 0 and line.lstrip('*')[0].isupper())):
+        return _EDGE_ASTERISKS_RE.sub('', line)
+
+    # Handle bullet points and clean up asterisks after colons
+    if line.strip().startswith('•'):
+        # Remove extra asterisks after colons, then any remaining multiple asterisks
+        return _DOUBLE_ASTERISKS_RE.sub('', _COLON_ASTERISKS_RE.sub(':', line))
+
+    # For all other lines, remove all asterisks
+    return _ASTERISKS_RE.sub('', line)
+
+def _layout_record(cleaned, text):
     # Handle section headings (e.g., "1.2 Modernization...")
-    if re.match(r'^\d+\.\d+\s+', line):
-        run = content_para.add_run(line)
-        run.bold = True
-        run.font.size = Pt(14)
-        run.font.name = 'Times New Roman'
-        content_para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-        content_para.paragraph_format.space_before = Pt(12)
-        content_para.paragraph_format.space_after = Pt(6)
-        return content_para
+    if _SECTION_HEADING_RE.match(text):
+        return LineRecord('heading', cleaned, text, None)
 
     # Handle subheadings (improved pattern to catch more cases)
-    if ((re.match(r'^[A-Z][A-Za-z\s]+(and|&)?[A-Za-z\s]+', line) and len(line.split()) <= 6) or
-        (len(line.split()) <= 4 and len(line) > 0 and line[0].isupper())):
-        run = content_para.add_run(line)
-        run.bold = True
-        run.font.size = Pt(12)  # Changed to 14pt
-        run.font.name = 'Times New Roman'
-        content_para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-        content_para.paragraph_format.space_before = Pt(12)
-        content_para.paragraph_format.space_after = Pt(6)
-        return content_para
+    words = len(text.split())
+    if (_SUBHEADING_RE.match(text) and words <= 6) or (words <= 4 and text[0].isupper()):
+        return LineRecord('subheading', cleaned, text, None)
 
-    # Handle bullet points
-    if line.startswith('•'):
-        line = line.replace('•', '').strip()
-        content_para.style = 'List Bullet'
-        content_para.paragraph_format.left_indent = Inches(0.5)
-        
-        # Handle bullet points with colons
-        if ':' in line:
-            before_colon, after_colon = line.split(':', 1)
-            run = content_para.add_run(before_colon + ':')
-            run.bold = True
-            run.font.size = Pt(12)
-            run.font.name = 'Times New Roman'
-            
-            run = content_para.add_run(after_colon)
-            run.font.size = Pt(12)
-            run.font.name = 'Times New Roman'
-        else:
-            run = content_para.add_run(line)
-            run.font.size = Pt(12)
-            run.font.name = 'Times New Roman'
-        
-        content_para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+    # Handle bullet points, splitting off a "Key Term:" prefix
+    if text.startswith('•'):
+        text = text.replace('•', '').strip()
+        if ':' in text:
+            before_colon, after_colon = text.split(':', 1)
+            return LineRecord('bullet', cleaned, after_colon, before_colon + ':')
+        return LineRecord('bullet', cleaned, text, None)
+
+    return LineRecord('paragraph', cleaned, text, None)
+
+def classify_line(line):
+    """Classify one line of raw LLM output in a single pass and return its LineRecord.
+
+    Asterisk markup is cleaned first and the layout is decided on the
+    stripped result.
+    """
+    if not line or not line.strip():
+        return BLANK_LINE
+    cleaned = _clean_line(line)
+    text = cleaned.strip()
+    if not text:
+        return LineRecord('blank', cleaned, '', None)
+    return _layout_record(cleaned, text)
+
+def tokenize_section(content):
+    """LineRecords for every line of a raw generated section"""
+    with metrics.timed('content_parsing'):
+        return [classify_line(line) for line in content.split('\n')]
+
+def write_line_record(doc, record, content_para=None):
+    """Render a LineRecord as a paragraph, creating one unless `content_para` is given"""
+    if content_para is None:
+        content_para = doc.add_paragraph()
+
+    if record.kind == 'blank':
         return content_para
 
-    # Handle regular text
-    run = content_para.add_run(line)
-    run.font.size = Pt(12)
-    run.font.name = 'Times New Roman'
-    content_para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+    # All formatting comes from the named styles (see add_report_styles)
+    _apply_style(content_para, RECORD_STYLES[record.kind])
+    if record.key is not None:
+        content_para.add_run(record.key)._r.style = STYLE_IDS['Key Term']
+    content_para.add_run(record.text)
     return content_para
 
 if __name__ == '__main__':
+    # Snapshots left by an earlier server would be added to this one's
+    metrics_store.clear()
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""Content-addressed storage for generated reports with size and age limits"""
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+
+_DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents as hex"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Files named by the hash of their contents, evicted least recently used first.
+
+    A file's mtime doubles as its last-access time: it is bumped on every
+    lookup, and eviction removes the oldest files once the directory is over
+    `max_bytes` or a file is older than `max_age` seconds (0 disables
+    either). Only files this store named are ever removed.
+    """
+
+    def __init__(self, directory, max_bytes=0, max_age=0, suffix='.docx'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def temp_path(self):
+        """Scratch path inside the store to write a new artifact to before commit()"""
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}.partial")
+
+    def commit(self, temp_path):
+        """Move a finished file into the store under its content hash and return the final path"""
+        digest = file_digest(temp_path)
+        path = os.path.join(self.directory, digest + self.suffix)
+        # Identical content is stored once; the rename is atomic either way
+        os.replace(temp_path, path)
+        os.utime(path)
+        self.evict(keep=path)
+        return path
+
+    def digest(self, path):
+        """The content hash an artifact path is named after, or None if it is not one of ours"""
+        if not path or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory):
+            return None
+        name = os.path.basename(path)
+        if not name.endswith(self.suffix) or not _DIGEST_RE.fullmatch(name[:-len(self.suffix)]):
+            return None
+        return name[:-len(self.suffix)]
+
+    def open_path(self, path):
+        """Return `path` if the artifact still exists, marking it as recently used; None if evicted"""
+        if self.digest(path) is None:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            if name.endswith(self.suffix) and _DIGEST_RE.fullmatch(name[:-len(self.suffix)]):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+        return entries
+
+    def evict(self, keep=None):
+        """Remove expired artifacts, then the least recently used until under the size limit.
+
+        `keep` (e.g. the artifact just written) is never removed.
+        """
+        if not self.max_bytes and not self.max_age:
+            return
+        with self.lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            cutoff = time.time() - self.max_age if self.max_age else None
+            for mtime, size, path in entries:
+                if path == keep:
+                    continue
+                expired = cutoff is not None and mtime < cutoff
+                if not expired and (not self.max_bytes or total <= self.max_bytes):
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
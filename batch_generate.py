@@ -0,0 +1,160 @@
+"""Generate reports for many titles in one run.
+
+Reads titles from a CSV file (columns: title, num_pages and optionally
+context_mode) or a JSONL file with the same keys. All section prompts go
+through one shared thread pool and the app's rate limiter, and each
+report is written to the output directory:
+
+    python batch_generate.py cohort.csv --output-dir reports --concurrency 8
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.utils import secure_filename
+
+import app
+
+
+class BatchReporter:
+    """Keeps a report's progress in memory for the summary line"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def progress(self, **changes):
+        with self.lock:
+            self.state.update(changes)
+
+    def event(self, kind, **data):
+        pass
+
+    def checkpoints(self):
+        return {}
+
+    def save_checkpoint(self, key, data):
+        pass
+
+
+def read_titles(path):
+    """Report params for every row of a .csv or .jsonl file"""
+    with open(path, newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    entries = []
+    for number, row in enumerate(rows, start=1):
+        title = (row.get('title') or '').strip()
+        if not title:
+            raise ValueError(f"{path}: row {number} has no title")
+        try:
+            num_pages = int(row.get('num_pages') or row.get('pages'))
+        except (TypeError, ValueError):
+            raise ValueError(f"{path}: row {number} has no valid num_pages") from None
+        if not app.MIN_PAGES <= num_pages <= app.MAX_PAGES:
+            raise ValueError(f"{path}: row {number} has num_pages {num_pages}, outside {app.MIN_PAGES}-{app.MAX_PAGES}")
+        context_mode = row.get('context_mode') or 'none'
+        if context_mode not in app.CONTEXT_MODES:
+            raise ValueError(f"{path}: row {number} has unknown context mode {context_mode!r}")
+        entries.append({'title': title, 'num_pages': num_pages, 'context_mode': context_mode})
+    return entries
+
+
+def output_paths(entries, output_dir):
+    """One .docx path per entry, adding the row number where titles would share a file name"""
+    names = [secure_filename(entry['title']) or 'report' for entry in entries]
+    # Compared case-insensitively, since that is how some file systems compare them
+    counts = {}
+    for name in names:
+        counts[name.lower()] = counts.get(name.lower(), 0) + 1
+    return [
+        os.path.join(output_dir, f"{name}-{number}.docx" if counts[name.lower()] > 1 else f"{name}.docx")
+        for number, name in enumerate(names, start=1)
+    ]
+
+
+def run_batch(entries, output_dir, concurrency, reports_in_flight, bypass_cache=False, template=None):
+    """Build every report, sharing one section pool; return (params, path or None, error or None) per entry.
+
+    `template` is a formatting template ID (see app.formatting_cache) applied to every report.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-section') as sections, \
+            ThreadPoolExecutor(max_workers=reports_in_flight, thread_name_prefix='batch-report') as reports:
+        # Report threads mostly wait on their sections, so they get a pool of their own
+        futures = {
+            reports.submit(
+                app.build_report,
+                dict(entry, bypass_cache=bypass_cache, template=template),
+                BatchReporter(),
+                sections,
+                path
+            ): entry
+            for entry, path in zip(entries, output_paths(entries, output_dir))
+        }
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                path = future.result()
+            except Exception as e:
+                results.append((entry, None, str(e)))
+                print(f"FAILED  {entry['title']}: {e}", file=sys.stderr)
+            else:
+                results.append((entry, path, None))
+                print(f"wrote   {path}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help=".csv or .jsonl file of titles and page counts")
+    parser.add_argument('--output-dir', default='reports')
+    parser.add_argument('--concurrency', type=int, default=app.app.config['GENERATION_CONCURRENCY'],
+                        help="section completions in flight across all reports")
+    parser.add_argument('--reports-in-flight', type=int, default=4,
+                        help="reports generating at once")
+    parser.add_argument('--bypass-cache', action='store_true')
+    parser.add_argument('--template', help="formatting template .docx applied to every report")
+    args = parser.parse_args(argv)
+
+    try:
+        entries = read_titles(args.input)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    template = None
+    if args.template:
+        try:
+            with open(args.template, 'rb') as f:
+                template, _ = app.formatting_cache.get_or_parse(f.read(), lambda data: app.extract_formatting(io.BytesIO(data)))
+        except Exception as e:
+            parser.error(f"{args.template}: not a readable .docx template ({e})")
+    os.makedirs(args.output_dir, exist_ok=True)
+    concurrency = max(1, args.concurrency)
+    reports_in_flight = max(1, args.reports_in_flight)
+    # Outlines are generated on the report threads, everything else on the section pool; the
+    # client is created on first use, so it still picks this up and no call waits for a connection
+    app.app.config['LLM_POOL_SIZE'] = concurrency + reports_in_flight
+
+    start = time.perf_counter()
+    results = run_batch(entries, args.output_dir, concurrency, reports_in_flight, args.bypass_cache, template)
+    elapsed = time.perf_counter() - start
+
+    failed = sum(1 for _, path, _ in results if path is None)
+    done = len(results) - failed
+    print(f"{done} reports written, {failed} failed in {elapsed:.1f}s "
+          f"({done / elapsed * 3600:.1f} reports/hour)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
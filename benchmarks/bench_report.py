@@ -0,0 +1,232 @@
+"""Benchmark the non-LLM cost of building a report.
+
+Runs the same stages as build_report against benchmarks.fake_llm and writes
+per-stage timings, peak memory and throughput to JSON:
+
+    python benchmarks/bench_report.py --pages 10 50 200 --iterations 3
+    python benchmarks/bench_report.py --compare benchmarks/results/<old>.json
+    python benchmarks/bench_report.py --writer python-docx
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep benchmark state out of the real instance folder and never throttle the fake backend
+_scratch = tempfile.mkdtemp(prefix='bench-report-')
+os.environ.setdefault('LLM_CACHE_PATH', os.path.join(_scratch, 'llm_cache.sqlite3'))
+os.environ.setdefault('JOB_DB_PATH', os.path.join(_scratch, 'jobs.sqlite3'))
+os.environ.setdefault('ARTIFACT_DIR', os.path.join(_scratch, 'artifacts'))
+os.environ.setdefault('TEMPLATE_DB_PATH', os.path.join(_scratch, 'templates.sqlite3'))
+os.environ['GROQ_REQUESTS_PER_MINUTE'] = '0'
+os.environ['GROQ_TOKENS_PER_MINUTE'] = '0'
+os.chdir(ROOT)
+
+import app  # noqa: E402
+from benchmarks.fake_llm import FakeLLMClient  # noqa: E402
+
+TITLE = "Edge Computing for Smart Cities"
+DATE = "Jan 2025"
+
+
+class NullReporter:
+    started = 0.0
+
+    def progress(self, **changes):
+        pass
+
+    def event(self, kind, **data):
+        pass
+
+    def checkpoints(self):
+        return {}
+
+    def save_checkpoint(self, key, data):
+        pass
+
+
+class StageTimer:
+    """Accumulates wall time spent inside a wrapped function across threads"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.total += elapsed
+
+
+def run_stages(num_pages):
+    """One report through the build_report stages, timing each"""
+    timings = {}
+    parse_timer = StageTimer(app.tokenize_section)
+    app.tokenize_section = parse_timer
+    use_python_docx = app.app.config['DOCX_WRITER'] == 'python-docx'
+    buffer = io.BytesIO()
+    try:
+        start = time.perf_counter()
+        if use_python_docx:
+            doc = app.new_report_document(TITLE, DATE)
+        else:
+            app._front_matter_template()
+        timings['front_matter'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = app.generate_project_report(TITLE, num_pages, bypass_cache=True)
+        timings['generation'] = time.perf_counter() - start
+        timings['content_parsing'] = parse_timer.total
+
+        if use_python_docx:
+            start = time.perf_counter()
+            app.write_report_body(doc, report)
+            timings['docx_assembly'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            doc.save(buffer)
+            timings['save'] = time.perf_counter() - start
+        else:
+            # The streaming writer assembles and saves in one pass
+            start = time.perf_counter()
+            app.stream_report(buffer, TITLE, DATE, report)
+            timings['docx_assembly'] = time.perf_counter() - start
+    finally:
+        app.tokenize_section = parse_timer.fn
+    timings['total'] = sum(value for key, value in timings.items() if key != 'content_parsing')
+    return timings, len(buffer.getvalue())
+
+
+def full_build(num_pages):
+    """End-to-end build_report, as a job worker would run it"""
+    start = time.perf_counter()
+    path = app.build_report({'title': TITLE, 'num_pages': num_pages, 'bypass_cache': True}, NullReporter())
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    return elapsed
+
+
+def bench(num_pages, iterations):
+    runs = [run_stages(num_pages) for _ in range(iterations)]
+    stages = {
+        stage: {
+            'median': statistics.median(timings[stage] for timings, _ in runs),
+            'min': min(timings[stage] for timings, _ in runs),
+        }
+        for stage in runs[0][0]
+    }
+
+    builds = [full_build(num_pages) for _ in range(iterations)]
+    tracemalloc.start()
+    full_build(num_pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'pages': num_pages,
+        'iterations': iterations,
+        'stages': stages,
+        'docx_bytes': runs[-1][1],
+        'build_seconds_median': statistics.median(builds),
+        'reports_per_second': 1.0 / statistics.median(builds),
+        # tracemalloc only sees Python allocations; lxml's C heap shows up in max RSS
+        'peak_memory_bytes': peak,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+
+
+def max_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(previous, current):
+    """Print median stage timings side by side with a previous result file"""
+    old = {entry['pages']: entry for entry in previous['results']}
+    print(f"\ncompared with {previous['revision']}:")
+    for entry in current['results']:
+        before = old.get(entry['pages'])
+        if before is None:
+            continue
+        for stage, values in entry['stages'].items():
+            if stage not in before['stages']:
+                continue
+            was = before['stages'][stage]['median']
+            change = (values['median'] - was) / was * 100 if was else 0.0
+            print(f"  {entry['pages']:>4} pages  {stage:<16} {was * 1000:9.1f} ms -> {values['median'] * 1000:9.1f} ms  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--output', help="result file (default: benchmarks/results/<revision>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--writer', choices=['stream', 'python-docx'], default=app.app.config['DOCX_WRITER'])
+    args = parser.parse_args(argv)
+
+    app.set_llm_client(FakeLLMClient())
+    app.app.config['DOCX_WRITER'] = args.writer
+    revision = git_revision()
+    results = []
+    for num_pages in args.pages:
+        entry = bench(num_pages, args.iterations)
+        results.append(entry)
+        stages = '  '.join(f"{stage}={values['median'] * 1000:.1f}ms" for stage, values in entry['stages'].items())
+        print(f"{num_pages:>4} pages: {stages}  peak={entry['peak_memory_bytes'] / 1e6:.1f}MB  "
+              f"{entry['reports_per_second']:.2f} reports/s")
+
+    report = {
+        'revision': revision,
+        'writer': args.writer,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'{revision}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Canned LLM backend that replays text from the sample reports in uploads/.
+
+Use it in place of Groq for benchmarks and offline runs, either with
+app.set_llm_client(FakeLLMClient()) or by starting the server with
+LLM_CLIENT_FACTORY=benchmarks.fake_llm:FakeLLMClient.
+"""
+import glob
+import os
+import re
+import time
+import zlib
+from types import SimpleNamespace
+
+from docx import Document
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SECTION_RE = re.compile(r'Generate section (\d+)\.(\d+)')
+CONTINUE_RE = re.compile(r'Continue section (\d+)\.(\d+)')
+TARGET_RE = re.compile(r'Target length: (\d+) words')
+HEADING_RE = re.compile(r'^\**\d+(\.\d+)+\.?\s')
+
+
+def load_corpus(corpus_dir=None):
+    """Body lines and reference entries from the generated chapters of every sample report"""
+    corpus_dir = corpus_dir or os.path.join(ROOT, 'uploads')
+    lines, references = [], []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, '*.docx'))):
+        paragraphs = [p.text for p in Document(path).paragraphs]
+        # The first "CHAPTER 1" belongs to the table of contents
+        starts = [i for i, text in enumerate(paragraphs) if text.startswith('CHAPTER 1')]
+        if not starts:
+            continue
+        for text in paragraphs[starts[-1]:]:
+            for line in text.split('\n'):
+                line = line.strip()
+                if not line or line.startswith('CHAPTER') or line == 'REFERENCES' or HEADING_RE.match(line):
+                    continue
+                if re.match(r'^\[\d+\]', line):
+                    references.append(re.sub(r'^\[\d+\]\s*', '', line))
+                else:
+                    lines.append(line)
+    if not lines:
+        raise RuntimeError(f"No sample report content found in {corpus_dir}")
+    if not references:
+        references = [
+            f'A. Author and B. Author, "{line[:60]}," IEEE Access, vol. {n}, pp. 1-10, 2021.'
+            for n, line in enumerate(lines[:20], start=1)
+        ]
+    return lines, references
+
+
+class FakeLLMClient:
+    """Duck-typed stand-in for groq.Groq answering section and reference prompts"""
+
+    def __init__(self, corpus_dir=None, latency=0.0, chunk_size=16):
+        self.lines, self.references = load_corpus(corpus_dir)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def section_text(self, prompt, max_tokens=None):
+        """Canned section in the markup the real model produces, sized to the prompt's target.
+
+        Like the real model, the answer stops once it reaches `max_tokens`.
+        """
+        continuation = CONTINUE_RE.search(prompt)
+        match = continuation or SECTION_RE.search(prompt)
+        section = f"{match.group(1)}.{match.group(2)}" if match else "1.1"
+        target = TARGET_RE.search(prompt)
+        target_words = int(target.group(1)) if target else 300
+        if max_tokens:
+            target_words = min(target_words, max_tokens * 3 // 4)
+
+        # Deterministic starting point per prompt so reports are reproducible
+        index = zlib.crc32((prompt if continuation else section).encode()) % len(self.lines)
+        out = [] if continuation else [f"**{section} Overview**"]
+        words = 0
+        while words < target_words:
+            line = self.lines[index % len(self.lines)]
+            index += 1
+            out.append(line)
+            words += len(line.split())
+        return '\n'.join(out)
+
+    def outline_text(self, prompt):
+        """One "<key> <title>: <points>" line for every section the prompt asks for"""
+        requested = re.search(r'these sections: (.*)', prompt)
+        keys = re.findall(r'\d+\.\d+', requested.group(1)) if requested else []
+        lines = []
+        for key in keys:
+            words = self.lines[zlib.crc32(key.encode()) % len(self.lines)].split()
+            lines.append(f"{key} {' '.join(words[:4])}: {' '.join(words[4:10])}; {' '.join(words[10:16])}")
+        return '\n'.join(lines)
+
+    def references_text(self):
+        return '\n'.join(f"[{n}] {entry}" for n, entry in enumerate(self.references[:20], start=1))
+
+    def create(self, model, messages, temperature=None, max_tokens=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]['content']
+        system = messages[0]['content'].lower()
+        if 'references' in system:
+            text = self.references_text()
+        elif 'outline' in system:
+            text = self.outline_text(prompt)
+        else:
+            text = self.section_text(prompt, max_tokens)
+
+        # Roughly 4/3 tokens per word, which is enough for usage bookkeeping
+        prompt_tokens = len(prompt.split()) * 4 // 3
+        completion_tokens = len(text.split()) * 4 // 3
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+        if stream:
+            return self._chunks(text, usage)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+    def _chunks(self, text, usage):
+        for i in range(0, len(text), self.chunk_size):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + self.chunk_size]))])
+        # Like Groq, usage comes on a final chunk without content
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))], x_groq=SimpleNamespace(usage=usage))
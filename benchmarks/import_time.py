@@ -0,0 +1,73 @@
+"""Check that importing the app stays within its cold-start budget.
+
+Imports the module in fresh interpreters under `python -X importtime`,
+prints the slowest imports of the median run and exits non-zero if the
+import takes longer than the budget or loads a dependency that should only
+be imported on first use:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module batch_generate --budget-ms 400
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once a document is built or the LLM is called
+LAZY_MODULES = ('docx', 'lxml', 'groq', 'httpx', 'pydantic')
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def measure(module):
+    """{imported module: cumulative microseconds} for one cold import of `module`"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_TIME_BUDGET_MS', 350)))
+    parser.add_argument('--runs', type=int, default=5, help="cold imports to take the median of")
+    parser.add_argument('--top', type=int, default=10, help="slowest top-level imports to list")
+    args = parser.parse_args(argv)
+
+    runs = sorted((measure(args.module) for _ in range(max(1, args.runs))), key=lambda times: times[args.module])
+    times = runs[len(runs) // 2]
+    total_ms = times[args.module] / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {len(runs)}, "
+          f"min {runs[0][args.module] / 1000:.1f} ms), budget {args.budget_ms:.0f} ms")
+    slowest = sorted(
+        ((name, us) for name, us in times.items() if name != args.module and '.' not in name),
+        key=lambda item: item[1], reverse=True
+    )
+    for name, us in slowest[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import {args.module} took {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    eager = [name for name in LAZY_MODULES if name in times]
+    if eager:
+        failures.append(f"import {args.module} loaded {', '.join(eager)}, which should be imported on first use")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
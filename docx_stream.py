@@ -0,0 +1,221 @@
+"""Streaming .docx writer that emits document.xml straight into the zip.
+
+The python-docx object model builds an lxml element for every paragraph,
+run and property before anything is written. DocxStreamWriter instead
+copies a template package part for part and appends the new body
+paragraphs to word/document.xml as they are produced. Formatting comes from
+named styles added to styles.xml once, so each paragraph is a style
+reference plus its text, and memory stays flat however long the report is.
+"""
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+DOCUMENT_PART = 'word/document.xml'
+STYLES_PART = 'word/styles.xml'
+
+_FONT = '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman"/>'
+_LINE_1_5 = 'w:line="360" w:lineRule="auto"'
+# Right-aligned, dot-leader page number at the right margin
+_TOC_TABS = '<w:tabs><w:tab w:val="right" w:leader="dot" w:pos="9360"/></w:tabs>'
+_SIGNATURE_TABS = '<w:tabs><w:tab w:val="left" w:pos="6480"/></w:tabs>'
+
+# Report styles as (type, style ID, name, based on, pPr children, rPr children),
+# shared by every writer so the same style names mean the same formatting.
+STYLES = (
+    ('paragraph', 'ReportHeading', 'Report Heading', 'Normal',
+     f'<w:spacing {_LINE_1_5}/><w:jc w:val="center"/>',
+     f'{_FONT}<w:b/><w:sz w:val="32"/>'),
+    ('paragraph', 'SectionHeading', 'Section Heading', 'Normal',
+     f'<w:spacing w:before="240" w:after="120" {_LINE_1_5}/><w:jc w:val="both"/>',
+     f'{_FONT}<w:b/><w:sz w:val="28"/>'),
+    ('paragraph', 'Subheading', 'Subheading', 'Normal',
+     f'<w:spacing w:before="240" w:after="120" {_LINE_1_5}/><w:jc w:val="both"/>',
+     f'{_FONT}<w:b/><w:sz w:val="24"/>'),
+    ('paragraph', 'Body', 'Body', 'Normal',
+     f'<w:spacing {_LINE_1_5}/><w:jc w:val="both"/>',
+     f'{_FONT}<w:sz w:val="24"/>'),
+    ('paragraph', 'BodyBullet', 'Body Bullet', 'ListBullet',
+     f'<w:spacing {_LINE_1_5}/><w:ind w:left="720"/><w:jc w:val="both"/>',
+     f'{_FONT}<w:sz w:val="24"/>'),
+    ('paragraph', 'Reference', 'Reference', 'Normal',
+     f'<w:spacing {_LINE_1_5}/><w:ind w:left="720" w:hanging="720"/><w:jc w:val="both"/>',
+     f'{_FONT}<w:sz w:val="24"/>'),
+    ('paragraph', 'TOCChapter', 'TOC Chapter', 'Normal', _TOC_TABS,
+     f'{_FONT}<w:b/><w:sz w:val="28"/>'),
+    ('paragraph', 'TOCEntry', 'TOC Entry', 'Normal', _TOC_TABS,
+     f'{_FONT}<w:sz w:val="24"/>'),
+    ('character', 'KeyTerm', 'Key Term', None, '', '<w:b/>'),
+    # Front matter: title page, bonafide certificate and the table of contents heading
+    ('paragraph', 'TitlePageTitle', 'Title Page Title', 'Normal',
+     f'<w:spacing {_LINE_1_5}/><w:jc w:val="center"/>',
+     f'{_FONT}<w:b/><w:sz w:val="36"/>'),
+    ('paragraph', 'TitlePageEmphasis', 'Title Page Emphasis', 'Normal',
+     f'<w:spacing {_LINE_1_5}/><w:jc w:val="center"/>',
+     f'{_FONT}<w:b/><w:i/><w:sz w:val="28"/>'),
+    ('paragraph', 'TitlePageName', 'Title Page Name', 'Normal',
+     '<w:jc w:val="center"/>',
+     f'{_FONT}<w:b/><w:sz w:val="32"/>'),
+    ('paragraph', 'TitlePageText', 'Title Page Text', 'Normal',
+     '<w:jc w:val="center"/>',
+     f'{_FONT}<w:sz w:val="28"/>'),
+    ('paragraph', 'CertificateHeading', 'Certificate Heading', 'Normal',
+     '<w:jc w:val="center"/>',
+     f'{_FONT}<w:b/><w:sz w:val="32"/>'),
+    ('paragraph', 'CertificateBody', 'Certificate Body', 'Normal',
+     '<w:jc w:val="both"/>',
+     f'{_FONT}<w:sz w:val="28"/>'),
+    ('paragraph', 'CertificateNote', 'Certificate Note', 'Normal', '',
+     f'{_FONT}<w:sz w:val="24"/>'),
+    # Two signatures a line, the second at 4.5"
+    ('paragraph', 'SignatureBlock', 'Signature Block', 'Normal', _SIGNATURE_TABS,
+     f'{_FONT}<w:b/><w:sz w:val="24"/>'),
+    ('paragraph', 'SignatureLine', 'Signature Line', 'Normal', _SIGNATURE_TABS,
+     f'{_FONT}<w:sz w:val="24"/>'),
+    ('paragraph', 'ContentsHeading', 'Contents Heading', 'Normal',
+     '<w:jc w:val="center"/>',
+     f'{_FONT}<w:b/><w:sz w:val="32"/><w:u w:val="single"/>'),
+    ('character', 'UnderlinedTerm', 'Underlined Term', None, '', '<w:u w:val="single"/>'),
+)
+
+# Writers refer to styles by name; the XML needs their IDs
+STYLE_IDS = {name: style_id for _, style_id, name, *_ in STYLES}
+
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+# Characters XML 1.0 cannot carry; python-docx refuses them outright
+_INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_RUN_BREAK_RE = re.compile(r'(\t|\r\n|\r|\n)')
+
+
+def is_xml_safe(text):
+    """False if `text` holds characters a .docx cannot carry (control characters other than tab and newlines)"""
+    return _INVALID_XML_RE.search(text) is None
+
+
+def style_xml(kind, style_id, name, based_on, ppr, rpr):
+    """w:style element for one STYLES entry"""
+    parts = [f'<w:style w:type="{kind}" w:customStyle="1" w:styleId="{style_id}">', f'<w:name w:val="{name}"/>']
+    if based_on:
+        parts.append(f'<w:basedOn w:val="{based_on}"/>')
+    parts.append('<w:qFormat/>')
+    if ppr:
+        parts.append(f'<w:pPr>{ppr}</w:pPr>')
+    if rpr:
+        parts.append(f'<w:rPr>{rpr}</w:rPr>')
+    parts.append('</w:style>')
+    return ''.join(parts)
+
+
+def style_element_xml(style):
+    """A STYLES entry as a standalone w:style string that declares its namespace"""
+    return style_xml(*style).replace('<w:style ', f'<w:style xmlns:w="{W_NS}" ', 1)
+
+
+def add_styles(styles_xml):
+    """Append any report styles missing from a styles.xml string"""
+    missing = [
+        style_xml(*style) for style in STYLES
+        if f'w:styleId="{style[1]}"' not in styles_xml
+    ]
+    if not missing:
+        return styles_xml
+    end = styles_xml.rindex('</w:styles>')
+    return styles_xml[:end] + ''.join(missing) + styles_xml[end:]
+
+
+def run_xml(text, char_style=None):
+    """w:r for `text`, turning tabs and line breaks into w:tab and w:br like python-docx"""
+    rpr = f'<w:rPr><w:rStyle w:val="{char_style}"/></w:rPr>' if char_style else ''
+    content = []
+    for piece in _RUN_BREAK_RE.split(_INVALID_XML_RE.sub('', text)):
+        if piece == '\t':
+            content.append('<w:tab/>')
+        elif piece in ('\r\n', '\r', '\n'):
+            content.append('<w:br/>')
+        elif piece:
+            content.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return f'<w:r>{rpr}{"".join(content)}</w:r>'
+
+
+def paragraph_xml(style_id, text, key=None):
+    """w:p in `style_id`, with an optional Key Term run before the text"""
+    key_run = run_xml(key, 'KeyTerm') if key else ''
+    return f'<w:p><w:pPr><w:pStyle w:val="{style_id}"/></w:pPr>{key_run}{run_xml(text)}</w:p>'
+
+
+class DocxStreamWriter:
+    """Writes a .docx from a template package, appending paragraphs to its body.
+
+    The template's body is kept as the start of the document; `replacements`
+    are (placeholder, value) pairs applied to its text in order. Paragraphs
+    are flushed to the zip in batches, so nothing beyond the current batch
+    is held in memory.
+    """
+
+    def __init__(self, template, output, replacements=(), flush_every=256):
+        self.flush_every = flush_every
+        self.pending = []
+        with zipfile.ZipFile(_as_file(template)) as source:
+            document_xml = source.read(DOCUMENT_PART).decode('utf-8')
+            # Keep the template's timestamp so the same report always zips to the same bytes
+            document_info = zipfile.ZipInfo(DOCUMENT_PART, source.getinfo(DOCUMENT_PART).date_time)
+            document_info.compress_type = zipfile.ZIP_DEFLATED
+            self.zip = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+            for info in source.infolist():
+                if info.filename == DOCUMENT_PART:
+                    continue
+                data = source.read(info.filename)
+                if info.filename == STYLES_PART:
+                    data = add_styles(data.decode('utf-8')).encode('utf-8')
+                self.zip.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED)
+
+        for placeholder, value in replacements:
+            document_xml = document_xml.replace(placeholder, escape(_INVALID_XML_RE.sub('', value)))
+        # The body-level sectPr is always the body's last child
+        split = document_xml.rindex('<w:sectPr')
+        self.tail = document_xml[split:]
+        self.stream = self.zip.open(document_info, 'w')
+        self.stream.write(document_xml[:split].encode('utf-8'))
+
+    def write(self, xml):
+        self.pending.append(xml)
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.stream.write(''.join(self.pending).encode('utf-8'))
+            self.pending = []
+
+    def paragraph(self, style, text, key=None):
+        """Append a paragraph in the named report style"""
+        self.write(paragraph_xml(STYLE_IDS[style], text, key))
+
+    def page_break(self):
+        self.write(PAGE_BREAK)
+
+    def close(self):
+        """Finish document.xml and the zip"""
+        self.flush()
+        self.stream.write(self.tail.encode('utf-8'))
+        self.stream.close()
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.stream.close()
+            self.zip.close()
+
+
+def _as_file(template):
+    if isinstance(template, (bytes, bytearray)):
+        return io.BytesIO(template)
+    return template
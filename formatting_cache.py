@@ -0,0 +1,64 @@
+"""Parsed formatting of uploaded template documents, keyed by their content hash"""
+import hashlib
+import json
+import threading
+import time
+
+from sqlite_store import SQLiteStore
+
+
+def template_id(data):
+    """Content hash identifying an uploaded template"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class FormattingCache(SQLiteStore):
+    """Formatting dicts shared by every worker through SQLite and kept in memory once read.
+
+    A template is parsed once no matter how many requests or workers see
+    it: get_or_parse() only calls the parser for content it has never seen.
+    """
+
+    def __init__(self, path):
+        super().__init__(
+            path,
+            'CREATE TABLE IF NOT EXISTS formatting ('
+            ' id TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' created REAL NOT NULL)'
+        )
+        self.memory = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """The formatting stored for template `key`, or None"""
+        with self.lock:
+            formatting = self.memory.get(key)
+        if formatting is not None:
+            return formatting
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM formatting WHERE id = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        formatting = json.loads(row[0])
+        with self.lock:
+            self.memory[key] = formatting
+        return formatting
+
+    def put(self, key, formatting):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO formatting (id, data, created) VALUES (?, ?, ?)',
+                (key, json.dumps(formatting), time.time())
+            )
+        with self.lock:
+            self.memory[key] = formatting
+
+    def get_or_parse(self, data, parse):
+        """Return (template ID, formatting) for template bytes, calling `parse(data)` only on a miss"""
+        key = template_id(data)
+        formatting = self.get(key)
+        if formatting is None:
+            formatting = parse(data)
+            self.put(key, formatting)
+        return key, formatting
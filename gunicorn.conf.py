@@ -0,0 +1,82 @@
+"""Gunicorn settings for serving the app in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Reports run on background threads inside each worker, so a restart drains
+them: a worker told to stop closes its listener and then waits up to
+REPORT_DRAIN_SECONDS for its running reports before exiting. Reports still
+unfinished by then, or left behind by a worker that crashed or was killed,
+are marked failed and resume from their checkpoints when retried.
+
+Each worker publishes its metrics to METRICS_DB_PATH, so /metrics reports
+the totals of all workers (including exited ones) whichever worker answers.
+"""
+import multiprocessing
+import os
+import time
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+# Threads keep status polls and event streams from queueing behind each other
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+chdir = os.path.dirname(os.path.abspath(__file__))
+# Import the app (python-docx, groq, front matter, logo, templates) once and fork it
+preload_app = True
+# Workers silent for this long are killed; a draining worker keeps reporting in (see worker_exit)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+drain_seconds = int(os.environ.get('REPORT_DRAIN_SECONDS', 900))
+# The master kills workers that outlive this, so leave the drain a little headroom
+graceful_timeout = drain_seconds + 30
+
+
+def _share(quota):
+    # 0 means unlimited and stays 0; any real quota leaves each worker at least 1
+    return quota and max(1, quota // workers)
+
+
+def when_ready(server):
+    import app
+
+    # Listening and no workers yet: start /metrics totals from zero rather than adding the previous server's
+    app.metrics_store.clear()
+
+
+def post_fork(server, worker):
+    import app
+    import metrics
+    from rate_limiter import RateLimiter
+
+    # Every worker has its own limiter, so each gets an even share of the account's quota
+    app.rate_limiter = RateLimiter(
+        _share(app.app.config['GROQ_REQUESTS_PER_MINUTE']),
+        _share(app.app.config['GROQ_TOKENS_PER_MINUTE'])
+    )
+    # Workers are also forked to replace one that died, possibly without draining its reports
+    app.job_queue.recover()
+    # gunicorn closes worker.tmp before worker_exit runs, so the drain heartbeat writes to a copy
+    worker.drain_heartbeat = os.dup(worker.tmp.fileno())
+    # Each worker's metrics reach /metrics in whichever worker serves the scrape
+    app.metrics_store.publish_every(metrics.registry, app.app.config['METRICS_PUBLISH_SECONDS'])
+
+
+def _heartbeat(fd):
+    # Same signal as Worker.notify(): the master reads the file's mtime against its monotonic clock
+    now = time.monotonic()
+    os.utime(fd, (now, now))
+
+
+def worker_exit(server, worker):
+    import app
+    import metrics
+
+    load = app.job_queue.load()
+    if load['running'] or load['queued']:
+        server.log.info("Worker %s draining %s running and %s queued reports", worker.pid, load['running'], load['queued'])
+    # Without a heartbeat the master would kill the worker `timeout` seconds into the drain
+    fd = getattr(worker, 'drain_heartbeat', None)
+    heartbeat = (lambda: _heartbeat(fd)) if fd is not None else None
+    if not app.job_queue.drain(drain_seconds, heartbeat, interval=max(1, timeout // 4)):
+        server.log.warning("Worker %s exited with reports unfinished; they are marked failed", worker.pid)
+    app.metrics_store.publish(metrics.registry)
@@ -0,0 +1,430 @@
+"""Background report jobs backed by a local SQLite store"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlite_store import SQLiteStore
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+ORPHANED_ERROR = "Interrupted when its server worker stopped; retry to resume from the finished sections"
+
+
+def _process_start(pid):
+    """Start time of process `pid` in clock ticks since boot, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is field 22; the fields are counted from after the command name, which may hold spaces
+    return int(stat.rsplit(b')', 1)[1].split()[19])
+
+
+def _process_token():
+    """Identifies this process among every process this host has run: "pid:start time".
+
+    A PID alone is reused, e.g. by a restarted container whose gunicorn
+    gets the same small PIDs as the last one.
+    """
+    pid = os.getpid()
+    start = _process_start(pid)
+    return str(pid) if start is None else f'{pid}:{start}'
+
+
+def _alive(token):
+    """True if the process `token` (see _process_token) is still running on this host"""
+    if not token:
+        return False
+    pid, _, start = str(token).partition(':')
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Another process that got the same PID started at a different time
+    if start:
+        current = _process_start(int(pid))
+        return current is None or str(current) == start
+    return True
+
+
+class JobStore(SQLiteStore):
+    """Job records shared by every thread and worker process on this host"""
+
+    def __init__(self, path):
+        super().__init__(
+            path,
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' params TEXT NOT NULL,'
+            ' progress TEXT NOT NULL,'
+            ' result_path TEXT,'
+            ' error TEXT,'
+            ' created REAL NOT NULL,'
+            ' updated REAL NOT NULL,'
+            ' dedup_key TEXT,'
+            ' worker TEXT)',
+            'CREATE TABLE IF NOT EXISTS job_events ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' job_id TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' created REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)',
+            'CREATE TABLE IF NOT EXISTS job_checkpoints ('
+            ' job_id TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' PRIMARY KEY (job_id, key))'
+        )
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'dedup_key' not in columns:
+                # Stores created before single-flight submissions
+                conn.execute('ALTER TABLE jobs ADD COLUMN dedup_key TEXT')
+            if 'worker' not in columns:
+                # Stores created before jobs recorded the process running them
+                conn.execute('ALTER TABLE jobs ADD COLUMN worker TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)')
+
+    def create_once(self, params, dedup_key, stale_after):
+        """Return (job_id, created): an active job with `dedup_key`, or a new queued one.
+
+        Jobs whose worker process is gone, or that have not been updated for
+        `stale_after` seconds, are not joined. The lookup and insert share one
+        write transaction, so concurrent callers in any process agree on one job.
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                'SELECT id, worker FROM jobs WHERE dedup_key = ? AND status IN (?, ?) AND updated >= ? ORDER BY created',
+                (dedup_key, QUEUED, RUNNING, now - stale_after)
+            ).fetchall()
+            for job_id, worker in rows:
+                if _alive(worker):
+                    conn.execute('COMMIT')
+                    return job_id, False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, status, params, progress, created, updated, dedup_key, worker)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, json.dumps(params), json.dumps({}), now, now, dedup_key, _process_token())
+            )
+            conn.execute('COMMIT')
+            return job_id, True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it does not exist"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, params, progress, result_path, error, created, updated FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'params': json.loads(row[2]),
+            'progress': json.loads(row[3]),
+            'result_path': row[4],
+            'error': row[5],
+            'created': row[6],
+            'updated': row[7],
+        }
+
+    def update(self, job_id, **fields):
+        """Set the given columns; `progress` is stored as JSON"""
+        if 'progress' in fields:
+            fields['progress'] = json.dumps(fields['progress'])
+        fields['updated'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def requeue(self, job_id, params):
+        """Move a job back to queued with new params, owned by this process.
+
+        Finished and failed jobs can be requeued, and so can queued or
+        running ones whose worker process is gone. Returns False if the job
+        is still active in a live worker.
+        """
+        conn = self._transaction()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT status, worker FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or (row[0] not in (DONE, FAILED) and _alive(row[1])):
+                conn.execute('COMMIT')
+                return False
+            conn.execute(
+                'UPDATE jobs SET status = ?, params = ?, error = NULL, updated = ?, worker = ? WHERE id = ?',
+                (QUEUED, json.dumps(params), time.time(), _process_token(), job_id)
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def fail_orphaned(self, error):
+        """Mark queued and running jobs whose worker process is gone as failed; return their IDs"""
+        conn = self._transaction()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT id, worker FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING)).fetchall()
+            orphaned = [job_id for job_id, worker in rows if not _alive(worker)]
+            conn.executemany(
+                'UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?',
+                [(FAILED, error, time.time(), job_id) for job_id in orphaned]
+            )
+            conn.execute('COMMIT')
+            return orphaned
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def counts(self):
+        """Number of jobs in each status, across every worker process"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict(rows)
+
+    def add_event(self, job_id, kind, data):
+        """Append an event to the job's event log"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO job_events (job_id, kind, data, created) VALUES (?, ?, ?, ?)',
+                (job_id, kind, json.dumps(data), time.time())
+            )
+
+    def events_since(self, job_id, last_id=0):
+        """Return (id, kind, data) for the job's events after `last_id`, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, kind, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id',
+                (job_id, last_id)
+            ).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def delete_events(self, job_id, kind):
+        """Drop the job's events of one kind"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM job_events WHERE job_id = ? AND kind = ?', (job_id, kind))
+
+    def purge(self, before):
+        """Delete finished and failed jobs last updated before `before`, with their events and checkpoints.
+
+        Returns the number of jobs deleted.
+        """
+        with self._connect() as conn:
+            job_ids = [row[0] for row in conn.execute(
+                'SELECT id FROM jobs WHERE status IN (?, ?) AND updated < ?', (DONE, FAILED, before)
+            )]
+            for table in ('job_events', 'job_checkpoints'):
+                conn.executemany(f'DELETE FROM {table} WHERE job_id = ?', [(job_id,) for job_id in job_ids])
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in job_ids])
+        return len(job_ids)
+
+    def save_checkpoint(self, job_id, key, data):
+        """Persist one unit of finished work (e.g. a generated section) for the job"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO job_checkpoints (job_id, key, data, created) VALUES (?, ?, ?, ?)',
+                (job_id, key, json.dumps(data), time.time())
+            )
+
+    def checkpoints(self, job_id):
+        """Return the job's checkpoints as {key: data}"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT key, data FROM job_checkpoints WHERE job_id = ?', (job_id,)).fetchall()
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+
+class JobReporter:
+    """Handed to the job runner to record progress and publish events"""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.started = time.time()
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def progress(self, **changes):
+        """Merge `changes` into the job's progress record"""
+        with self.lock:
+            self.state.update(changes)
+            self.store.update(self.job_id, progress=self.state)
+
+    def event(self, kind, **data):
+        """Publish an event to streaming consumers"""
+        data.setdefault('elapsed', round(time.time() - self.started, 3))
+        self.store.add_event(self.job_id, kind, data)
+
+    def checkpoints(self):
+        """Work saved by earlier runs of this job"""
+        return self.store.checkpoints(self.job_id)
+
+    def save_checkpoint(self, key, data):
+        """Save finished work so a retry of this job can skip it"""
+        self.store.save_checkpoint(self.job_id, key, data)
+
+
+class JobQueue:
+    """Runs jobs on a background thread pool and records their progress.
+
+    Jobs finished or failed more than `ttl` seconds ago (0 keeps them) are
+    deleted, checkpoints included, whenever a job ends or a process recovers.
+    """
+
+    def __init__(self, store, runner, workers=2, ttl=0):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.ttl = ttl
+        self.executor = None
+        self.lock = threading.Lock()
+        # Jobs submitted to this process and not yet finished, and the subset now running
+        self.pending = set()
+        self.running = set()
+        self.idle = threading.Condition(self.lock)
+
+    def _get_executor(self):
+        # Created on first use so no threads exist before a server forks its workers
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report-job')
+            return self.executor
+
+    def _dispatch(self, job_id):
+        executor = self._get_executor()
+        with self.lock:
+            self.pending.add(job_id)
+        executor.submit(self._run, job_id)
+
+    def submit_once(self, params, dedup_key, stale_after=600):
+        """Queue a job for `params`, or join the active job with the same `dedup_key`.
+
+        Returns (job_id, created) immediately.
+        """
+        job_id, created = self.store.create_once(params, dedup_key, stale_after)
+        if created:
+            self._dispatch(job_id)
+        return job_id, created
+
+    def resubmit(self, job_id, params):
+        """Run a finished or failed job again with `params`; its checkpoints are kept.
+
+        A job left queued or running by a dead worker can be run again too.
+        Returns False if the job is still queued or running in a live worker.
+        """
+        if not self.store.requeue(job_id, params):
+            return False
+        JobReporter(self.store, job_id).event('status', status=QUEUED)
+        self._dispatch(job_id)
+        return True
+
+    def load(self):
+        """This process's share of the work: jobs running, jobs waiting and worker threads"""
+        with self.lock:
+            return {
+                'running': len(self.running),
+                'queued': len(self.pending) - len(self.running),
+                'workers': self.workers,
+            }
+
+    def drain(self, timeout=None, heartbeat=None, interval=10):
+        """Wait for every job submitted to this process to finish, e.g. before a worker exits.
+
+        `heartbeat()` is called every `interval` seconds while waiting, so a
+        supervisor watching the process knows it is not hung. Jobs still
+        unfinished after `timeout` seconds, or when the wait is cut short
+        (e.g. by a signal), are marked failed, so they can be retried
+        (resuming from their checkpoints) once the server is back. Returns
+        True if everything finished in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                with self.lock:
+                    wait = interval if deadline is None else min(interval, deadline - time.monotonic())
+                    if not self.pending or wait <= 0:
+                        break
+                    self.idle.wait_for(lambda: not self.pending, wait)
+                if heartbeat is not None:
+                    heartbeat()
+        finally:
+            with self.lock:
+                unfinished = list(self.pending)
+            for job_id in unfinished:
+                self.store.update(job_id, status=FAILED, error=ORPHANED_ERROR)
+                JobReporter(self.store, job_id).event('status', status=FAILED, error=ORPHANED_ERROR)
+        return not unfinished
+
+    def recover(self):
+        """Fail the jobs of worker processes that died without draining, e.g. on a crash or SIGKILL.
+
+        Meant to run whenever a process starts serving, so a dead worker's
+        jobs do not stay queued or running forever. Returns their IDs.
+        """
+        orphaned = self.store.fail_orphaned(ORPHANED_ERROR)
+        for job_id in orphaned:
+            JobReporter(self.store, job_id).event('status', status=FAILED, error=ORPHANED_ERROR)
+        self._purge()
+        return orphaned
+
+    def _purge(self):
+        if self.ttl:
+            self.store.purge(time.time() - self.ttl)
+
+    def _finish(self, job_id):
+        # Line events only matter while the job runs; each section event carries the same text
+        self.store.delete_events(job_id, 'line')
+        self._purge()
+
+    def _run(self, job_id):
+        with self.lock:
+            self.running.add(job_id)
+        try:
+            self._run_job(job_id)
+            self._finish(job_id)
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+                self.pending.discard(job_id)
+                self.idle.notify_all()
+
+    def _run_job(self, job_id):
+        job = self.store.get(job_id)
+        reporter = JobReporter(self.store, job_id)
+        self.store.update(job_id, status=RUNNING)
+        reporter.event('status', status=RUNNING)
+        try:
+            result_path = self.runner(job['params'], reporter)
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, error=str(e))
+            reporter.event('status', status=FAILED, error=str(e))
+            return
+        self.store.update(job_id, status=DONE, result_path=result_path, error=None)
+        reporter.event('status', status=DONE)
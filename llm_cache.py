@@ -0,0 +1,71 @@
+"""Content-addressed on-disk cache for LLM completions"""
+import hashlib
+import json
+import time
+
+from sqlite_store import SQLiteStore
+
+
+def cache_key(model, system_prompt, user_prompt, temperature, max_tokens):
+    """Stable hash of everything that determines a completion"""
+    payload = json.dumps(
+        [model, system_prompt, user_prompt, temperature, max_tokens],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache(SQLiteStore):
+    """SQLite-backed completion cache with TTL expiry and LRU eviction by total size"""
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        super().__init__(
+            path,
+            'CREATE TABLE IF NOT EXISTS completions ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' accessed REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)'
+        )
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        """Return the cached text for `key`, or None if missing or expired"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, created FROM completions WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute('DELETE FROM completions WHERE key = ?', (key,))
+                row = None
+            if row is not None:
+                conn.execute('UPDATE completions SET accessed = ? WHERE key = ?', (now, key))
+        return None if row is None else row[0]
+
+    def put(self, key, value):
+        """Store `value` under `key` and evict least recently used entries over the size cap"""
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO completions (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, value, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute('DELETE FROM completions WHERE created < ?', (now - self.ttl_seconds,))
+        if not self.max_bytes:
+            return
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM completions').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute('SELECT key, size FROM completions ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM completions WHERE key = ?', (key,))
+            total -= size
@@ -0,0 +1,340 @@
+"""In-process metrics with Prometheus text exposition and per-report traces"""
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from sqlite_store import SQLiteStore
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def render(self, others=()):
+        """Exposition lines for this process's values plus `others`' snapshots"""
+        with self.lock:
+            values = defaultdict(float, self.values)
+        for snapshot in others:
+            for key, value in snapshot:
+                values[tuple(key)] += value
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), dict(series, counts=list(series['counts']))] for key, series in self.series.items()]
+
+    def render(self, others=()):
+        """Exposition lines for this process's series plus `others`' snapshots"""
+        merged = {tuple(key): series for key, series in self.snapshot()}
+        for snapshot in others:
+            for key, series in snapshot:
+                total = merged.setdefault(tuple(key), {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+                total['counts'] = [a + b for a, b in zip(total['counts'], series['counts'])]
+                total['sum'] += series['sum']
+                total['count'] += series['count']
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{labels} {series["count"]}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series["sum"])}')
+            lines.append(f'{self.name}_count{labels} {series["count"]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """{metric name: its values}, JSON-serialisable"""
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def render(self, others=()):
+        """Prometheus text for this process's metrics summed with `others`' snapshots"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render([snapshot.get(metric.name, []) for snapshot in others]))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsStore(SQLiteStore):
+    """Latest registry snapshot of every process serving the app, so any one can report them all.
+
+    Each process publishes under its own key and keeps its row after it
+    exits, so counters stay monotonic across worker restarts. clear()
+    starts over; call it once when the server starts, before any worker
+    has published.
+    """
+
+    def __init__(self, path):
+        super().__init__(
+            path,
+            'CREATE TABLE IF NOT EXISTS snapshots ('
+            ' process TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' updated REAL NOT NULL)'
+        )
+        self.owner = None
+        self.lock = threading.Lock()
+
+    def _key(self):
+        # A fresh key per process: forked workers inherit the parent's, and PIDs are reused
+        with self.lock:
+            if self.owner is None or self.owner[0] != os.getpid():
+                self.owner = (os.getpid(), uuid.uuid4().hex)
+            return self.owner[1]
+
+    def publish(self, registry):
+        """Store this process's current snapshot of `registry`"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshots (process, data, updated) VALUES (?, ?, ?)',
+                (self._key(), json.dumps(registry.snapshot()), time.time())
+            )
+
+    def others(self):
+        """Snapshots published by every other process"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT data FROM snapshots WHERE process != ?', (self._key(),)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def render(self, registry):
+        """Prometheus text for `registry` summed across every process"""
+        self.publish(registry)
+        return registry.render(self.others())
+
+    def publish_every(self, registry, interval):
+        """Publish `registry` from a daemon thread every `interval` seconds"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.publish(registry)
+                except sqlite3.Error:
+                    # Busy or briefly unavailable; the next round publishes the same totals
+                    pass
+        threading.Thread(target=loop, name='metrics-publish', daemon=True).start()
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM snapshots')
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    'report_stage_seconds', "Time spent in each report building stage", ['stage']))
+llm_request_seconds = registry.register(Histogram(
+    'llm_request_seconds', "LLM completion latency, excluding rate limiter waits", ['model']))
+llm_requests = registry.register(Counter(
+    'llm_requests_total', "LLM completions by outcome", ['model', 'outcome']))
+llm_prompt_tokens = registry.register(Counter(
+    'llm_prompt_tokens_total', "Prompt tokens reported by the LLM", ['model']))
+llm_completion_tokens = registry.register(Counter(
+    'llm_completion_tokens_total', "Completion tokens reported by the LLM", ['model']))
+llm_retries = registry.register(Counter(
+    'llm_retries_total', "Retries after rate-limited responses", ['model']))
+llm_wait_seconds = registry.register(Counter(
+    'llm_rate_limit_wait_seconds_total', "Time spent waiting on the rate limiter or backoff", ['model']))
+llm_cache_hits = registry.register(Counter(
+    'llm_cache_hits_total', "Completions served from the on-disk cache", ['model']))
+llm_routes = registry.register(Counter(
+    'llm_routes_total', "Models chosen by the router, by reason", ['model', 'reason']))
+
+
+class Trace:
+    """Per-report summary of stage timings and LLM usage"""
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.routes = []
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] += seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def route(self, label, model, reason):
+        with self.lock:
+            self.routes.append([label, model, reason])
+
+    def summary(self):
+        with self.lock:
+            summary = {
+                'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                'counts': dict(self.counts),
+            }
+            if self.routes:
+                summary['routes'] = list(self.routes)
+            return summary
+
+
+_current_trace = contextvars.ContextVar('report_trace', default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def trace():
+    """Collect a Trace for everything run in this context (and copies of it)"""
+    new_trace = Trace()
+    token = _current_trace.set(new_trace)
+    try:
+        yield new_trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    active = _current_trace.get()
+    if active is not None:
+        active.add(stage, seconds)
+
+
+def record_count(name, amount=1):
+    active = _current_trace.get()
+    if active is not None:
+        active.count(name, amount)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time the enclosed block as `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_llm_call(model, seconds, outcome, waited=0.0, retries=0, usage=None):
+    """Record one LLM completion in the global metrics and the current trace"""
+    llm_requests.inc(model=model, outcome=outcome)
+    llm_request_seconds.observe(seconds, model=model)
+    if retries:
+        llm_retries.inc(retries, model=model)
+    if waited:
+        llm_wait_seconds.inc(waited, model=model)
+    prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+    if prompt_tokens:
+        llm_prompt_tokens.inc(prompt_tokens, model=model)
+    if completion_tokens:
+        llm_completion_tokens.inc(completion_tokens, model=model)
+
+    active = _current_trace.get()
+    if active is not None:
+        active.add('llm', seconds)
+        active.add('llm_wait', waited)
+        active.count('llm_calls')
+        active.count('llm_retries', retries)
+        active.count('prompt_tokens', prompt_tokens)
+        active.count('completion_tokens', completion_tokens)
+
+
+def record_cache_hit(model):
+    llm_cache_hits.inc(model=model)
+    record_count('llm_cache_hits')
+
+
+def record_route(label, model, reason):
+    """Record the model picked for a call: 'route', 'probe', 'unhealthy' or 'failover'"""
+    llm_routes.inc(model=model, reason=reason)
+    active = _current_trace.get()
+    if active is not None:
+        active.route(label, model, reason)
+        if reason == 'failover':
+            active.count('llm_failovers')
+
+
+def server_timing(summary):
+    """Format a trace summary as a Server-Timing header value"""
+    return ', '.join(
+        f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in summary['stages'].items()
+    )
@@ -0,0 +1,94 @@
+"""Model choice per kind of completion, with running health estimates and failover"""
+import sys
+import threading
+import time
+
+from rate_limiter import is_rate_limit_error
+
+
+def is_timeout_error(exc):
+    """True for timeouts from the LLM client, including SDK errors wrapping an httpx timeout"""
+    # An httpx timeout can only exist once the client has imported httpx
+    httpx = sys.modules.get('httpx')
+    timeouts = (TimeoutError, httpx.TimeoutException) if httpx is not None else (TimeoutError,)
+    while exc is not None:
+        if isinstance(exc, timeouts) or type(exc).__name__ == 'APITimeoutError':
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def is_failover_error(exc):
+    """Errors worth retrying on another model: timeouts and 429s"""
+    return is_rate_limit_error(exc) or is_timeout_error(exc)
+
+
+class ModelHealth:
+    """Exponentially weighted latency and error rate of one model"""
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.last_attempt = 0.0
+
+
+class ModelRouter:
+    """Orders the models to try for each route.
+
+    `routes` maps a route name (e.g. 'section', 'references') to its
+    preferred model; every other model in `models` is a fallback, fastest
+    first by running latency. A preferred model whose error rate is above
+    `max_error_rate`, or whose latency is above `max_latency` seconds
+    (0 disables), is moved behind the fallbacks until `probe_after` seconds
+    have passed since it was last tried, so it gets a chance to recover.
+    """
+
+    def __init__(self, routes, models, weight=0.2, max_error_rate=0.5, max_latency=0, probe_after=60, min_samples=3):
+        self.routes = dict(routes)
+        # Preserve order and drop duplicates (e.g. the same model configured twice)
+        self.models = list(dict.fromkeys(list(models) + list(self.routes.values())))
+        self.weight = weight
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.probe_after = probe_after
+        self.min_samples = min_samples
+        self.health = {model: ModelHealth() for model in self.models}
+        self.lock = threading.Lock()
+
+    def _unhealthy(self, health):
+        if health.samples < self.min_samples:
+            return False
+        if health.error_rate > self.max_error_rate:
+            return True
+        return bool(self.max_latency) and health.latency is not None and health.latency > self.max_latency
+
+    def candidates(self, route):
+        """(model, reason) pairs to try in order for `route`"""
+        preferred = self.routes[route]
+        with self.lock:
+            # Models with no latency sample yet sort after measured ones
+            fallbacks = sorted(
+                (model for model in self.models if model != preferred),
+                key=lambda model: (self.health[model].latency is None, self.health[model].latency or 0.0)
+            )
+            health = self.health[preferred]
+            if not fallbacks or not self._unhealthy(health):
+                return [(preferred, 'route')] + [(model, 'failover') for model in fallbacks]
+            if time.monotonic() - health.last_attempt >= self.probe_after:
+                return [(preferred, 'probe')] + [(model, 'failover') for model in fallbacks]
+            return [(fallbacks[0], 'unhealthy')] + [(model, 'failover') for model in fallbacks[1:] + [preferred]]
+
+    def attempt(self, model):
+        """Note that `model` is about to be called"""
+        with self.lock:
+            self.health[model].last_attempt = time.monotonic()
+
+    def observe(self, model, seconds, ok):
+        """Fold one completion's latency and outcome into the model's estimates"""
+        with self.lock:
+            health = self.health.setdefault(model, ModelHealth())
+            health.error_rate += self.weight * ((0.0 if ok else 1.0) - health.error_rate)
+            if ok:
+                health.latency = seconds if health.latency is None else health.latency + self.weight * (seconds - health.latency)
+            health.samples += 1
@@ -0,0 +1,130 @@
+"""Process-wide token-bucket rate limiting for LLM calls"""
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Bucket holding up to `per_minute` units, refilled continuously over a minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take `amount` units now and return how long the caller must wait for them"""
+        # A single request larger than the whole bucket would never fit
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.rate
+
+    def refund(self, amount):
+        """Give back units that were reserved but not used"""
+        if amount <= 0:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level + amount)
+
+
+def retry_after_seconds(exc):
+    """Read the retry-after hint from a 429 error, if the server sent one"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    for header, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            continue
+    return None
+
+
+def is_rate_limit_error(exc):
+    """True for HTTP 429 errors raised by the LLM client"""
+    return getattr(exc, 'status_code', None) == 429
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter shared by every thread"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_retries=5,
+                 base_backoff=1.0, max_backoff=60.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def acquire(self, tokens):
+        """Block until a request and `tokens` tokens are available; return seconds waited"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def backoff(self, attempt, exc):
+        """Jittered exponential backoff, never shorter than the server's retry-after"""
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        hint = retry_after_seconds(exc)
+        if hint is not None:
+            delay = max(delay, hint + random.uniform(0, self.base_backoff))
+        return delay
+
+    def call(self, fn, estimated_tokens, used_tokens=None, max_retries=None):
+        """Run `fn()` under the limiter, retrying 429s.
+
+        Returns (result, stats) where stats records how long this call waited.
+        If `fn()` fails for good, the exception carries the same stats as its
+        `limiter_stats` attribute.
+        `used_tokens(result)` may report actual usage so unused tokens are refunded.
+        `max_retries` overrides the limiter's own for this call (0 raises the first 429).
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        stats = {'waited': 0.0, 'retries': 0}
+        attempt = 0
+        while True:
+            stats['waited'] += self.acquire(estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= max_retries:
+                    e.limiter_stats = stats
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                stats['retries'] = attempt
+                stats['waited'] += delay
+                time.sleep(delay)
+                continue
+
+            if used_tokens is not None:
+                self.refund(estimated_tokens, used_tokens(result))
+            return result, stats
+
+    def refund(self, estimated_tokens, actual_tokens):
+        """Return the part of a call's token estimate it did not use, once its usage is known.
+
+        For calls whose usage only arrives after call() returns, e.g. streams.
+        """
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.refund(min(estimated_tokens, self.tokens.capacity) - actual_tokens)
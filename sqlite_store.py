@@ -0,0 +1,28 @@
+"""Base for stores kept in a SQLite file shared by every thread and worker process on this host"""
+import os
+import sqlite3
+
+
+class SQLiteStore:
+    """Opens `path` in WAL mode, creating its directory, and runs `schema` statements once.
+
+    Every operation uses its own short-lived connection, which keeps a
+    store safe to share across threads and forked worker processes.
+    """
+
+    def __init__(self, path, *schema):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in schema:
+                conn.execute(statement)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _transaction(self):
+        # Manual transaction control, so BEGIN IMMEDIATE can take the write lock before a lookup
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
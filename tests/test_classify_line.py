@@ -0,0 +1,106 @@
+"""classify_line against the two passes it replaced.
+
+Until the single-pass classifier, a line went through the asterisk cleanup
+of process_content_section and then, stripped, through the layout rules of
+add_formatted_content. Both are reproduced here as they were, minus the
+python-docx calls, and compared with classify_line on generated lines.
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Importing the app opens its stores; keep them out of the real instance folder
+_scratch = tempfile.mkdtemp(prefix='test-classify-')
+os.environ.setdefault('LLM_CACHE_PATH', os.path.join(_scratch, 'llm_cache.sqlite3'))
+os.environ.setdefault('JOB_DB_PATH', os.path.join(_scratch, 'jobs.sqlite3'))
+os.environ.setdefault('ARTIFACT_DIR', os.path.join(_scratch, 'artifacts'))
+os.environ.setdefault('TEMPLATE_DB_PATH', os.path.join(_scratch, 'templates.sqlite3'))
+
+import app  # noqa: E402
+
+
+def clean_line(line):
+    """One line of the previous process_content_section"""
+    if not line or len(line.strip()) == 0:
+        return ''
+    if re.match(r'^[\*]+\d+\.\d+\s+', line) or re.match(r'^\d+\.\d+\s+', line):
+        return re.sub(r'^[\*]+|\*+$', '', line)
+    if (re.match(r'^[\*]+[A-Z][A-Za-z\s]+(and|&)?[A-Za-z\s]+', line) or
+            (len(line.split()) <= 4 and len(line.lstrip('*')) > 0 and line.lstrip('*')[0].isupper())):
+        return re.sub(r'^[\*]+|\*+$', '', line)
+    if line.strip().startswith('•'):
+        line = re.sub(r':\s*\*+', ':', line)
+        return re.sub(r'\*{2,}', '', line)
+    return re.sub(r'\*+', '', line)
+
+
+def layout(line):
+    """(kind, key, text) the previous add_formatted_content rendered a stripped line as"""
+    if not line:
+        return 'blank', None, ''
+    if re.match(r'^\d+\.\d+\s+', line):
+        return 'heading', None, line
+    if ((re.match(r'^[A-Z][A-Za-z\s]+(and|&)?[A-Za-z\s]+', line) and len(line.split()) <= 6) or
+            (len(line.split()) <= 4 and len(line) > 0 and line[0].isupper())):
+        return 'subheading', None, line
+    if line.startswith('•'):
+        line = line.replace('•', '').strip()
+        if ':' in line:
+            before_colon, after_colon = line.split(':', 1)
+            return 'bullet', before_colon + ':', after_colon
+        return 'bullet', None, line
+    return 'paragraph', None, line
+
+
+# Pieces LLM output is made of, weighted towards the markup the rules look at
+TOKENS = (
+    '*', '**', '***', '•', '• ', '1.2', '3.10 ', '12.4', ':', ': ', ':**', '&', 'and', 'And',
+    'System', 'Design', 'Key Features', 'of', 'the', 'IoT', 'edge', 'a', 'x', 'Z', '2024', '.', '-', '#',
+    'é', 'Über', '(', ')', '"', ' ', ' ', ' ', '  ', '\t',
+)
+
+
+def generated_lines(count, seed=11):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 12)))
+
+
+class ClassifyLineTest(unittest.TestCase):
+
+    def assert_same(self, line):
+        record = app.classify_line(line)
+        cleaned = clean_line(line)
+        kind, key, text = layout(cleaned.strip())
+        self.assertEqual((record.kind, record.key, record.text), (kind, key, text), repr(line))
+        if kind != 'blank':
+            self.assertEqual(record.line, cleaned, repr(line))
+
+    def test_generated_lines(self):
+        for line in generated_lines(3000):
+            self.assert_same(line)
+
+    def test_typical_lines(self):
+        for line in (
+            '', '   ', '**', '**1.2 Problem Statement**', '1.2 Problem Statement',
+            '**System Architecture and Design**', 'Short Line Here', '• **Key:** value here',
+            '• plain bullet', '  • **Latency**: under 10 ms', 'Some **text** here that is long enough.',
+            '***', '*Note*: see below', 'Research & Development Plan',
+        ):
+            self.assert_same(line)
+
+    def test_section_text_matches_cleaned_completion(self):
+        content = '\n'.join(generated_lines(200, seed=5))
+        records = [app.classify_line(line) for line in content.split('\n')]
+        expected = '\n'.join(clean_line(line) for line in content.split('\n')).strip()
+        self.assertEqual(app.Section.from_records('1.1', records).text, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+"""The app's cold import stays within benchmarks/import_time.py's budget and imports nothing lazy"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import import_time  # noqa: E402
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_lazy_modules_not_imported(self):
+        times = import_time.measure('app')
+        self.assertIn('app', times)
+        self.assertEqual([name for name in import_time.LAZY_MODULES if name in times], [])
+
+    def test_within_budget(self):
+        # main() takes the median of several cold imports and fails over budget or on an eager import
+        self.assertEqual(import_time.main(['--runs', '3', '--top', '0']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Word targets for report sections and completion token limits derived from them"""
+import math
+import threading
+
+
+class TokenCalibrator:
+    """Running estimate of completion tokens per generated word.
+
+    Each observed completion moves the ratio a fraction of the way towards
+    its own tokens/words, so the estimate follows the model and prompt
+    style without any one response swinging it.
+    """
+
+    def __init__(self, initial_ratio=1.5, weight=0.2, headroom=1.25, step=256):
+        self.ratio = initial_ratio
+        self.weight = weight
+        # Extra room over the expected length so a section is not cut off mid-sentence
+        self.headroom = headroom
+        # max_tokens is rounded up to this step so it stays stable (and cacheable) as the ratio drifts
+        self.step = step
+        self.lock = threading.Lock()
+
+    def observe(self, completion_tokens, words):
+        """Fold one completion's token and word counts into the ratio"""
+        # Very short answers are dominated by formatting tokens
+        if not completion_tokens or words < 50:
+            return
+        with self.lock:
+            self.ratio += self.weight * (completion_tokens / words - self.ratio)
+
+    def max_tokens(self, words, limit):
+        """Token limit for a completion of about `words` words, capped at `limit`"""
+        tokens = math.ceil(words * self.ratio * self.headroom / self.step) * self.step
+        return min(limit, max(self.step, tokens))
+
+    def words_per_call(self, limit):
+        """Most words one completion capped at `limit` tokens can be asked for"""
+        return max(1, int(limit / (self.ratio * self.headroom)))
+
+    def snapshot(self):
+        """A copy fixed at the current ratio, for sizing every completion of one job alike"""
+        with self.lock:
+            return TokenCalibrator(self.ratio, self.weight, self.headroom, self.step)
+
+
+class WordBudget:
+    """Feeds each section's shortfall or surplus into the sections that have not started yet.
+
+    target() hands out a section's planned words adjusted by an even share
+    of the running carry-over, and record() adds the difference between
+    that target and the words actually generated. Adjustments are rounded
+    to `step` of the planned size and limited to `max_adjust` either way,
+    so one bad completion cannot starve or bloat the rest of the report.
+    """
+
+    def __init__(self, plan, step=0.1, max_adjust=0.5):
+        self.planned = {section_key: words for _, section_key, words in plan}
+        self.targets = {}
+        self.not_started = set(self.planned)
+        self.carry = 0
+        self.step = step
+        self.max_adjust = max_adjust
+        self.lock = threading.Lock()
+
+    def target(self, section_key):
+        """Words to ask for in `section_key`, taking its share of the carry-over"""
+        with self.lock:
+            planned = self.planned[section_key]
+            share = self.carry / max(1, len(self.not_started))
+            self.not_started.discard(section_key)
+            factor = 1.0
+            if planned:
+                factor = min(1 + self.max_adjust, max(1 - self.max_adjust, 1 + share / planned))
+                factor = round(factor / self.step) * self.step
+            target = int(round(planned * factor))
+            self.carry -= target - planned
+            self.targets[section_key] = target
+            return target
+
+    def record(self, section_key, words):
+        """Count the words a section actually came out with"""
+        with self.lock:
+            self.not_started.discard(section_key)
+            target = self.targets.get(section_key, self.planned[section_key])
+            self.carry += target - words
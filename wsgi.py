@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module loads the app and preloads the shared report assets;
+with preload_app (see gunicorn.conf.py) that happens once in the master
+before the workers are forked.
+"""
+from app import app, preload
+
+preload()